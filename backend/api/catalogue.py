@@ -0,0 +1,134 @@
+import gzip
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from foodgram.models import Ingredient, Tag
+from foodgram.signals import reference_data_changed
+
+from .metrics import record_cache
+from .renderers import FastJSONRenderer
+from .representations import INGREDIENT_FIELDS, TAG_FIELDS
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CATALOGUES = {
+    'ingredients': (Ingredient, INGREDIENT_FIELDS),
+    'tags': (Tag, TAG_FIELDS),
+}
+CACHE_KEY = 'catalogue:{}:{}'
+VERSION_KEY = 'catalogue_version:{}'
+# Версии хранятся в общем кэше по умолчанию (memcached), поэтому новая
+# версия сразу видна всем процессам. TIMEOUT только освобождает кэш от
+# собранных старых версий.
+TIMEOUT = 60 * 60 * 24
+
+
+def get_version(name):
+    return cache.get_or_set(VERSION_KEY.format(name), time.time, None)
+
+
+def build_catalogue(name, version):
+    """Рендерит весь справочник в JSON и сжатые варианты с ETag."""
+    model, fields = CATALOGUES[name]
+    content = FastJSONRenderer().render(list(model.objects.values(*fields)))
+    entry = {
+        'etag': f'"{hashlib.sha1(content).hexdigest()}"',
+        'identity': content,
+        'gzip': gzip.compress(content),
+    }
+    if brotli is not None:
+        entry['br'] = brotli.compress(content)
+    cache.set(CACHE_KEY.format(name, version), entry, TIMEOUT)
+    return entry
+
+
+def get_catalogue(name):
+    """Справочник текущей версии. Версия читается до обращения к БД,
+    поэтому справочник, собранный во время изменения, сохраняется под
+    старой версией."""
+    version = get_version(name)
+    entry = cache.get(CACHE_KEY.format(name, version))
+    record_cache('catalogue', entry is not None, entry is None)
+    if entry is None:
+        entry = build_catalogue(name, version)
+    return entry
+
+
+def invalidate(name):
+    transaction.on_commit(
+        lambda: cache.set(VERSION_KEY.format(name), time.time(), None)
+    )
+
+
+def choose_encoding(request, entry):
+    accepted = {
+        encoding.split(';')[0].strip()
+        for encoding in request.META.get('HTTP_ACCEPT_ENCODING', '').split(',')
+    }
+    for encoding in ('br', 'gzip'):
+        if encoding in accepted and encoding in entry:
+            return encoding
+    return 'identity'
+
+
+def strip_weak(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def etag_matches(request, etag):
+    """Слабое сравнение ETag со списком из If-None-Match."""
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if '*' in etags:
+        return True
+    return strip_weak(etag) in {strip_weak(tag) for tag in etags}
+
+
+def catalogue_response(request, name):
+    """Отдаёт заранее собранный справочник без обращения к ORM.
+
+    Годится только для JSON: представления вызывают её, если
+    согласованный рендерер — JSON, а для ?format=api и других форматов
+    используют обычный list.
+    """
+    entry = get_catalogue(name)
+    if etag_matches(request, entry['etag']):
+        response = HttpResponseNotModified()
+    else:
+        encoding = choose_encoding(request, entry)
+        response = HttpResponse(
+            entry[encoding], content_type='application/json'
+        )
+        if encoding != 'identity':
+            response['Content-Encoding'] = encoding
+    response['ETag'] = entry['etag']
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    invalidate('ingredients')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    invalidate('tags')
+
+
+@receiver(reference_data_changed)
+def invalidate_loaded(sender, **kwargs):
+    for name, (model, _) in CATALOGUES.items():
+        if model is sender:
+            invalidate(name)
@@ -0,0 +1,63 @@
+"""Параллельное чтение для горячих GET-эндпоинтов под ASGI.
+
+В Django 3.2 ORM синхронный, а синхронные представления под ASGI
+выполняются в одном общем потоке. Обёртка concurrent_reads запускает
+безопасные запросы в ограниченном пуле потоков; у каждого потока своё
+соединение с БД, которое переиспользуется в пределах CONN_MAX_AGE.
+Изменяющие запросы, как и раньше, выполняются в общем потоке.
+"""
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .profiling import profile_pool_thread
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+READ_ROUTES = {
+    'recipe-list', 'recipe-detail', 'ingredient-list', 'ingredient-detail',
+    'tag-list', 'tag-detail', 'user-subscriptions',
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_READ_THREADS,
+    thread_name_prefix='async-read'
+)
+
+
+def run_view(view, request, *args, **kwargs):
+    close_old_connections()
+    try:
+        with profile_pool_thread():
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response = response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def concurrent_reads(view):
+    run_in_pool = sync_to_async(
+        run_view, thread_sensitive=False, executor=executor
+    )
+    run_in_main = sync_to_async(view, thread_sensitive=True)
+
+    @functools.wraps(view)
+    async def async_view(request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return await run_in_pool(view, request, *args, **kwargs)
+        return await run_in_main(request, *args, **kwargs)
+
+    return async_view
+
+
+def with_concurrent_reads(urls):
+    """Оборачивает маршруты из READ_ROUTES, если включён ASYNC_READS."""
+    if settings.ASYNC_READS:
+        for pattern in urls:
+            if getattr(pattern, 'name', None) in READ_ROUTES:
+                pattern.callback = concurrent_reads(pattern.callback)
+    return urls
@@ -1,23 +1,60 @@
+from django import forms
+from django.core.exceptions import ValidationError
 from django_filters import rest_framework as filters
-from rest_framework.filters import SearchFilter
 
-from foodgram.models import Recipe, User
+from foodgram.models import Recipe, Tag, User
+from foodgram.search import search_recipes
+from .recipe_index import (ids_or_query, ingredient_recipe_index,
+                           query_missing_at_most, query_with_all,
+                           query_with_any)
 
 
-class IngredientSearchFilter(SearchFilter):
-    search_param = 'name'
+class IntegerFilter(filters.NumberFilter):
+    field_class = forms.IntegerField
+
+
+class IntegerInFilter(filters.BaseInFilter, IntegerFilter):
+    pass
+
+
+class RecipeFilterForm(forms.Form):
+    def clean(self):
+        cleaned_data = super().clean()
+        if (cleaned_data.get('max_missing') is not None
+                and not cleaned_data.get('ingredients_any')):
+            raise ValidationError({
+                'max_missing': 'max_missing задаётся вместе с ingredients_any'
+            })
+        return cleaned_data
 
 
 class AuthorAndTagFilter(filters.FilterSet):
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    """Фильтры ленты рецептов.
+
+    ingredients, ingredients_any и exclude_ingredients принимают id через
+    запятую. max_missing оставляет рецепты из ingredients_any, которым не
+    хватает не больше указанного числа ингредиентов, и без ingredients_any
+    возвращает ошибку 400.
+    """
+    tags = filters.ModelMultipleChoiceFilter(
+        field_name='tags__slug',
+        to_field_name='slug',
+        queryset=Tag.objects.all()
+    )
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
+    ingredients = IntegerInFilter(method='filter_ingredients')
+    ingredients_any = IntegerInFilter(method='filter_ingredients_any')
+    exclude_ingredients = IntegerInFilter(method='filter_exclude_ingredients')
+    max_missing = IntegerFilter(method='filter_max_missing', min_value=0)
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author')
+        form = RecipeFilterForm
 
     def filter_is_favorited(self, queryset, name, value):
         if value and not self.request.user.is_anonymous:
@@ -28,3 +65,28 @@ class AuthorAndTagFilter(filters.FilterSet):
         if value and not self.request.user.is_anonymous:
             return queryset.filter(cart__user=self.request.user)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_ingredients(self, queryset, name, value):
+        return queryset.filter(pk__in=ids_or_query(
+            ingredient_recipe_index.with_all(value), query_with_all(value)
+        ))
+
+    def filter_ingredients_any(self, queryset, name, value):
+        return queryset.filter(pk__in=ids_or_query(
+            ingredient_recipe_index.with_any(value), query_with_any(value)
+        ))
+
+    def filter_exclude_ingredients(self, queryset, name, value):
+        return queryset.exclude(pk__in=ids_or_query(
+            ingredient_recipe_index.with_any(value), query_with_any(value)
+        ))
+
+    def filter_max_missing(self, queryset, name, value):
+        available = self.form.cleaned_data['ingredients_any']
+        return queryset.filter(pk__in=ids_or_query(
+            ingredient_recipe_index.missing_at_most(available, value),
+            query_missing_at_most(available, value)
+        ))
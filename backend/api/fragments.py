@@ -0,0 +1,52 @@
+"""Кэш сериализованных рецептов без полей, зависящих от пользователя.
+
+Фрагмент рецепта хранится в кэше ответов вместе с метками рецепта, автора
+и тегов и проверяется по ним так же, как закэшированные ответы ленты:
+сигналы из response_cache сдвигают время изменения метки, и фрагменты с
+этой меткой перестают считаться свежими. Страница ленты читается из кэша
+двумя вызовами get_many: фрагменты и времена их меток.
+"""
+from django.conf import settings
+
+from .metrics import record_cache
+from .representations import recipe_fragments
+from .response_cache import (get_cache, is_fresh, recipe_tags, store_many,
+                             tag_keys)
+
+FRAGMENT_KEY = 'recipe_fragment:{}:{}'
+
+
+def get_fragments(recipes, request, started=None):
+    """Возвращает {id рецепта: фрагмент} для списка рецептов.
+
+    Недостающие фрагменты строятся одной пачкой и сохраняются, если
+    известно время начала запроса started.
+    """
+    cache = get_cache()
+    host = request.get_host() if request else ''
+    keys = {recipe.pk: FRAGMENT_KEY.format(host, recipe.pk)
+            for recipe in recipes}
+    entries = cache.get_many(keys.values())
+    versions = cache.get_many(tag_keys(entries.values()))
+    fragments = {}
+    missing = []
+    for recipe in recipes:
+        entry = entries.get(keys[recipe.pk])
+        if entry is not None and is_fresh(entry, versions):
+            fragments[recipe.pk] = entry['data']
+        else:
+            missing.append(recipe)
+    record_cache('fragments', len(fragments), len(missing))
+    if not missing:
+        return fragments
+    built = {}
+    for pk, data in recipe_fragments(missing, request).items():
+        fragments[pk] = data
+        built[keys[pk]] = {
+            'data': data,
+            'tags': set(recipe_tags(data)),
+            'started': started,
+        }
+    if started is not None:
+        store_many(built, settings.RESPONSE_CACHE_TIMEOUT)
+    return fragments
@@ -0,0 +1,140 @@
+import bisect
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from foodgram.models import Ingredient
+from foodgram.signals import reference_data_changed
+
+SEARCH_LIMIT = 20
+TRIGRAM_THRESHOLD = 0.3
+VERSION_KEY = 'ingredient_index_version'
+MAX_AGE = 300
+
+
+def normalize(value):
+    return value.casefold().replace('ё', 'е').strip()
+
+
+def trigrams(value):
+    padded = f'  {value} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов в памяти процесса для автодополнения.
+
+    Строится лениво при первом запросе и перестраивается, когда меняется
+    версия в кэше (её сбрасывает сохранение или удаление ингредиента)
+    или истекает MAX_AGE секунд.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._built_at = 0
+        self._keys = []
+        self._items = []
+        self._postings = {}
+        self._sizes = []
+
+    def invalidate(self):
+        cache.set(VERSION_KEY, time.time(), None)
+        self._version = None
+
+    def _is_stale(self):
+        return (
+            self._version is None
+            or self._version != cache.get(VERSION_KEY)
+            or time.monotonic() - self._built_at > MAX_AGE
+        )
+
+    def _build(self):
+        cache.add(VERSION_KEY, time.time(), None)
+        version = cache.get(VERSION_KEY)
+        rows = sorted(
+            (normalize(name), pk, name, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )
+        )
+        postings = {}
+        sizes = []
+        for position, row in enumerate(rows):
+            row_trigrams = trigrams(row[0])
+            sizes.append(len(row_trigrams))
+            for trigram in row_trigrams:
+                postings.setdefault(trigram, []).append(position)
+        self._keys = [row[0] for row in rows]
+        self._items = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, pk, name, measurement_unit in rows
+        ]
+        self._postings = postings
+        self._sizes = sizes
+        self._built_at = time.monotonic()
+        self._version = version
+
+    def _ensure_built(self):
+        if self._is_stale():
+            with self._lock:
+                if self._is_stale():
+                    self._build()
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Префиксные совпадения, затем подстроки, затем похожие по триграммам.
+        """
+        self._ensure_built()
+        query = normalize(query)
+        keys = self._keys
+        if not query:
+            return self._items[:limit]
+        found = []
+        seen = set()
+        start = bisect.bisect_left(keys, query)
+        for position in range(start, len(keys)):
+            if len(found) >= limit or not keys[position].startswith(query):
+                break
+            found.append(position)
+            seen.add(position)
+        if len(found) < limit:
+            for position, key in enumerate(keys):
+                if len(found) >= limit:
+                    break
+                if position not in seen and query in key:
+                    found.append(position)
+                    seen.add(position)
+        if len(found) < limit:
+            found.extend(self._similar(query, seen, limit - len(found)))
+        return [self._items[position] for position in found]
+
+    def _similar(self, query, seen, limit):
+        query_trigrams = trigrams(query)
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(self._postings.get(trigram, ()))
+        scored = []
+        for position, count in shared.items():
+            if position in seen:
+                continue
+            score = count / (
+                len(query_trigrams) + self._sizes[position] - count
+            )
+            if score >= TRIGRAM_THRESHOLD:
+                scored.append((-score, self._keys[position], position))
+        scored.sort()
+        return [position for _, _, position in scored[:limit]]
+
+
+ingredient_index = IngredientIndex()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(reference_data_changed, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
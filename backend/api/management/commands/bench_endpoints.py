@@ -0,0 +1,168 @@
+import statistics
+import time
+
+from django.core.cache import caches
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from foodgram.models import Amount, Recipe
+from users.models import User
+
+# Имя, URL, нужен ли токен, бюджет запросов к БД, бюджет p95 в мс.
+# В URL подставляются id рецепта, автора и ингредиентов из текущей базы.
+ENDPOINTS = (
+    ('recipes', '/api/recipes/', False, 4, 150),
+    ('recipes_auth', '/api/recipes/', True, 5, 150),
+    ('recipes_page', '/api/recipes/?page=3&limit=20', False, 4, 200),
+    ('recipes_cursor', '/api/recipes/?cursor=', False, 3, 150),
+    ('recipes_tags', '/api/recipes/?tags=breakfast&tags=dinner',
+     False, 5, 150),
+    ('recipes_author', '/api/recipes/?author={author}', False, 5, 150),
+    ('recipes_favorited', '/api/recipes/?is_favorited=1', True, 5, 150),
+    ('recipes_search', '/api/recipes/?search=суп', False, 4, 250),
+    ('recipes_ingredients', '/api/recipes/?ingredients={ingredients}',
+     False, 4, 200),
+    ('recipe_detail', '/api/recipes/{recipe}/', True, 4, 100),
+    ('tags', '/api/tags/', False, 1, 50),
+    ('ingredients', '/api/ingredients/', False, 1, 100),
+    ('ingredients_search', '/api/ingredients/?name=сах', False, 1, 50),
+    ('users', '/api/users/', True, 2, 100),
+    ('users_me', '/api/users/me/', True, 1, 50),
+    ('subscriptions', '/api/users/subscriptions/?recipes_limit=3',
+     True, 3, 150),
+    ('shopping_cart', '/api/recipes/download_shopping_cart/', True, 1, 200),
+)
+
+
+class QueryTimer:
+    """Считает запросы к БД и суммарное время их выполнения."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет эндпоинты через тестовый клиент: p50 и p95 задержки, '
+        'число и время SQL-запросов. Завершается с ошибкой при выходе '
+        'за бюджет'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--user', help='Email пользователя для запросов '
+                                           'с токеном')
+        parser.add_argument('--only', nargs='+', metavar='NAME',
+                            help='Замерить только эти эндпоинты')
+        parser.add_argument('--warm', action='store_true',
+                            help='Не очищать кэш ответов перед запросом')
+        parser.add_argument('--latency-factor', type=float, default=1.0,
+                            help='Множитель бюджетов задержки')
+        parser.add_argument('--no-latency-budget', action='store_true',
+                            help='Проверять только бюджеты запросов')
+
+    def get_user(self, email):
+        if email:
+            return User.objects.get(email=email)
+        user = User.objects.annotate(
+            follows=Count('follower', distinct=True),
+            carts=Count('cart', distinct=True),
+        ).order_by('-follows', '-carts', 'pk').first()
+        if user is None:
+            raise CommandError(
+                'В базе нет пользователей, запустите generate_data'
+            )
+        return user
+
+    def get_placeholders(self):
+        recipe = Recipe.objects.order_by('-pub_date').first()
+        if recipe is None:
+            raise CommandError('В базе нет рецептов, запустите generate_data')
+        ingredients = Amount.objects.filter(recipe=recipe).values_list(
+            'ingredient_id', flat=True
+        )[:2]
+        return {
+            'recipe': recipe.pk,
+            'author': recipe.author_id,
+            'ingredients': ','.join(map(str, ingredients)),
+        }
+
+    def measure(self, client, url, clear_cache):
+        if clear_cache:
+            caches['responses'].clear()
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            raise CommandError(f'{url}: ответ {response.status_code}')
+        return elapsed * 1000, timer.count, timer.seconds * 1000
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        clients = {
+            False: Client(),
+            True: Client(HTTP_AUTHORIZATION=f'Token {token.key}'),
+        }
+        placeholders = self.get_placeholders()
+        self.stdout.write(
+            f'{"эндпоинт":<22}{"p50, мс":>9}{"p95, мс":>9}'
+            f'{"запросов":>10}{"SQL, мс":>9}'
+        )
+        failures = []
+        for name, url, auth, query_budget, latency_budget in ENDPOINTS:
+            if options['only'] and name not in options['only']:
+                continue
+            url = url.format(**placeholders)
+            client = clients[auth]
+            for _ in range(options['warmup']):
+                self.measure(client, url, not options['warm'])
+            samples = [
+                self.measure(client, url, not options['warm'])
+                for _ in range(options['runs'])
+            ]
+            latencies = [latency for latency, _, _ in samples]
+            queries = max(count for _, count, _ in samples)
+            sql_time = statistics.median(seconds for _, _, seconds in samples)
+            p95 = percentile(latencies, 0.95)
+            self.stdout.write(
+                f'{name:<22}{statistics.median(latencies):>9.1f}{p95:>9.1f}'
+                f'{queries:>10}{sql_time:>9.1f}'
+            )
+            if queries > query_budget:
+                failures.append(
+                    f'{name}: {queries} запросов при бюджете {query_budget}'
+                )
+            latency_budget *= options['latency_factor']
+            if not options['no_latency_budget'] and p95 > latency_budget:
+                failures.append(
+                    f'{name}: p95 {p95:.1f} мс при бюджете '
+                    f'{latency_budget:.0f} мс'
+                )
+        if failures:
+            raise CommandError(
+                'Превышены бюджеты:\n' + '\n'.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS('Все бюджеты соблюдены'))
@@ -0,0 +1,103 @@
+import random
+import statistics
+import time
+
+from django.core.management import BaseCommand
+from django.db.models import Count
+
+from api.recipe_index import (ids_or_query, ingredient_recipe_index,
+                              query_missing_at_most, query_with_all,
+                              query_with_any)
+from foodgram.models import Amount, Recipe
+
+
+def recipe_page(recipe_ids, limit):
+    """То же, что делает лента с отфильтрованным queryset: COUNT и первая
+    страница, оба запроса с фильтром pk__in."""
+    queryset = Recipe.objects.filter(pk__in=recipe_ids).order_by('-pub_date')
+    return queryset.count(), list(
+        queryset.values_list('id', flat=True)[:limit]
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает фильтрацию рецептов по ингредиентам через '
+        'инвертированный индекс и через агрегирующий запрос к Amount: '
+        'отдельно подбор id и вместе с COUNT и страницей ленты, куда '
+        'результат индекса передаётся списком pk__in, а длиннее '
+        'MAX_INLINE_IDS — подзапросом'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=50)
+        parser.add_argument('--size', type=int, default=3,
+                            help='Сколько ингредиентов в запросе')
+        parser.add_argument('--missing', type=int, default=2)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--limit', type=int, default=6,
+                            help='Размер страницы ленты')
+
+    def measure(self, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        return (time.perf_counter() - start) * 1000, result
+
+    def handle(self, *args, **options):
+        popular = list(
+            Amount.objects.values('ingredient_id').annotate(
+                total=Count('id')
+            ).order_by('-total').values_list('ingredient_id', flat=True)[:50]
+        )
+        if len(popular) < options['size']:
+            self.stdout.write(self.style.WARNING('Недостаточно данных'))
+            return
+        ingredient_recipe_index.with_any([])
+        rng = random.Random(options['seed'])
+        cases = {
+            'ingredients': (query_with_all, ingredient_recipe_index.with_all),
+            'ingredients_any': (
+                query_with_any, ingredient_recipe_index.with_any
+            ),
+            'max_missing': (
+                query_missing_at_most, ingredient_recipe_index.missing_at_most
+            ),
+        }
+        limit = options['limit']
+        for name, (naive, indexed) in cases.items():
+            times = {key: [] for key in (
+                'naive', 'index', 'naive_page', 'index_page'
+            )}
+            for _ in range(options['runs']):
+                ids = rng.sample(popular, options['size'])
+                extra = (options['missing'],) if name == 'max_missing' else ()
+                naive_time, expected = self.measure(
+                    lambda: set(naive(ids, *extra))
+                )
+                index_time, actual = self.measure(indexed, ids, *extra)
+                if expected != actual:
+                    self.stderr.write(f'{name}: результаты расходятся {ids}')
+                naive_page_time, naive_page = self.measure(
+                    recipe_page, naive(ids, *extra), limit
+                )
+                index_page_time, index_page = self.measure(
+                    lambda: recipe_page(ids_or_query(
+                        indexed(ids, *extra), naive(ids, *extra)
+                    ), limit)
+                )
+                if naive_page[0] != index_page[0]:
+                    self.stderr.write(f'{name}: страницы расходятся {ids}')
+                times['naive'].append(naive_time)
+                times['index'].append(index_time)
+                times['naive_page'].append(naive_page_time)
+                times['index_page'].append(index_page_time)
+            median = {
+                key: statistics.median(values)
+                for key, values in times.items()
+            }
+            self.stdout.write(
+                f'{name}: запрос {median["naive"]:.2f} мс, '
+                f'индекс {median["index"]:.3f} мс; со страницей ленты: '
+                f'подзапрос {median["naive_page"]:.2f} мс, '
+                f'индекс и pk__in {median["index_page"]:.2f} мс (медиана)'
+            )
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from api.profiling import sign_header
+
+
+class Command(BaseCommand):
+    help = (
+        'Выдаёт значение заголовка X-Profile для профилирования запроса '
+        'без прав администратора'
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(sign_header())
+        self.stderr.write(
+            f'Подпись действительна {settings.PROFILE_SIGNATURE_MAX_AGE} с'
+        )
@@ -0,0 +1,43 @@
+from django.db.models import CharField, Value
+
+from foodgram.models import Cart, Favorite, Follow
+
+KINDS = {
+    Favorite: ('favorites', 'recipe_id'),
+    Cart: ('cart', 'recipe_id'),
+    Follow: ('follows', 'author_id'),
+}
+
+
+def empty_membership():
+    return {kind: set() for kind, _ in KINDS.values()}
+
+
+def load_membership(user_id):
+    """Загружает избранное, корзину и подписки пользователя одним запросом.
+    """
+    queries = [
+        model.objects.filter(user_id=user_id).annotate(
+            kind=Value(kind, output_field=CharField())
+        ).values_list(field, 'kind').order_by()
+        for model, (kind, field) in KINDS.items()
+    ]
+    membership = empty_membership()
+    for object_id, kind in queries[0].union(*queries[1:], all=True):
+        membership[kind].add(object_id)
+    return membership
+
+
+def get_membership(user):
+    """Множества id избранных рецептов, рецептов в корзине и авторов.
+
+    Множества читаются из БД один раз за запрос и запоминаются на объекте
+    пользователя. Между запросами они не кэшируются: кэш в памяти процесса
+    расходился бы между воркерами, а запрос по индексам (user_id, ...)
+    дешевле его согласования.
+    """
+    if not user.is_authenticated:
+        return empty_membership()
+    if not hasattr(user, '_membership_cache'):
+        user._membership_cache = load_membership(user.id)
+    return user._membership_cache
@@ -0,0 +1,293 @@
+"""Метрики в формате Prometheus, общие для всех процессов gunicorn.
+
+Каждый процесс пишет значения в свой файл METRICS_DIR/metrics_<pid>.db,
+отображённый в память: запись — это поиск смещения в словаре и
+struct.pack_into. Эндпоинт /api/metrics читает файлы всех процессов и
+складывает значения с одинаковыми ключами. Файлы завершившихся процессов
+не удаляются, чтобы счётчики не уменьшались.
+"""
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+INITIAL_SIZE = 64 * 1024
+HEADER = struct.Struct('i')
+ENTRY_HEADER = struct.Struct('i')
+VALUE = struct.Struct('d')
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+METRICS = {
+    'foodgram_requests_total': (
+        'counter', 'Число запросов по маршруту, методу и статусу'
+    ),
+    'foodgram_request_duration_seconds': (
+        'histogram', 'Время обработки запроса'
+    ),
+    'foodgram_request_queries': (
+        'histogram', 'Число SQL-запросов на HTTP-запрос'
+    ),
+    'foodgram_response_size_bytes': ('histogram', 'Размер тела ответа'),
+    'foodgram_cache_requests_total': (
+        'counter', 'Обращения к кэшам: попадания и промахи'
+    ),
+    'foodgram_cache_hit_ratio': (
+        'gauge', 'Доля попаданий в кэш с момента запуска'
+    ),
+}
+
+
+class MmapValues:
+    """Словарь «ключ → число» в отображённом в память файле.
+
+    Формат: длина занятой части, затем записи (длина ключа, ключ,
+    выравнивание до 8 байт, значение double). Значения меняются через
+    memoryview по индексу, без struct на каждую запись.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(INITIAL_SIZE)
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), self._size)
+        self._values = memoryview(self._map).cast('d')
+        self._positions = {}
+        self._used = HEADER.unpack_from(self._map, 0)[0] or 8
+        for key, _, position in read_entries(self._map, self._used):
+            name, labels = json.loads(key)
+            key = (name, tuple(sorted(labels.items())))
+            self._positions[key] = position // VALUE.size
+
+    def _grow(self):
+        self._size *= 2
+        self._values.release()
+        self._map.close()
+        self._file.truncate(self._size)
+        self._map = mmap.mmap(self._file.fileno(), self._size)
+        self._values = memoryview(self._map).cast('d')
+
+    def _allocate(self, key):
+        name, labels = key
+        encoded = json.dumps(
+            [name, dict(labels)], separators=(',', ':'), sort_keys=True
+        ).encode()
+        padding = 8 - (ENTRY_HEADER.size + len(encoded)) % 8
+        entry = (
+            ENTRY_HEADER.pack(len(encoded)) + encoded + b' ' * padding
+        )
+        needed = self._used + len(entry) + VALUE.size
+        while needed > self._size:
+            self._grow()
+        self._map[self._used:self._used + len(entry)] = entry
+        index = (self._used + len(entry)) // VALUE.size
+        self._values[index] = 0.0
+        self._used = needed
+        HEADER.pack_into(self._map, 0, self._used)
+        self._positions[key] = index
+        return index
+
+    def add(self, items):
+        """Прибавляет значения; items — пары ((имя, метки), число), где
+        метки — отсортированный кортеж пар."""
+        with self._lock:
+            for key, amount in items:
+                index = self._positions.get(key)
+                if index is None:
+                    index = self._allocate(key)
+                self._values[index] += amount
+
+
+def read_entries(data, used):
+    position = 8
+    while position < used:
+        length = ENTRY_HEADER.unpack_from(data, position)[0]
+        key_start = position + ENTRY_HEADER.size
+        key = bytes(data[key_start:key_start + length]).decode()
+        value_position = key_start + length
+        value_position += 8 - value_position % 8
+        value = VALUE.unpack_from(data, value_position)[0]
+        yield key, value, value_position
+        position = value_position + VALUE.size
+
+
+_store = None
+_store_pid = None
+
+
+def get_store():
+    """Хранилище текущего процесса; после fork создаётся заново."""
+    global _store, _store_pid
+    pid = os.getpid()
+    if _store_pid != pid:
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        _store = MmapValues(
+            os.path.join(settings.METRICS_DIR, f'metrics_{pid}.db')
+        )
+        _store_pid = pid
+    return _store
+
+
+def inc(name, labels, amount=1):
+    if settings.METRICS_DIR:
+        get_store().add(
+            [((name, tuple(sorted(labels.items()))), amount)]
+        )
+
+
+def histogram_items(name, labels, value, buckets):
+    """Гистограмма: хранится число попаданий в каждый бакет, сумма и
+    количество; накопленные значения считаются при выдаче."""
+    index = bisect_left(buckets, value)
+    bound = str(buckets[index]) if index < len(buckets) else '+Inf'
+    return (
+        ((f'{name}_bucket', tuple(sorted((*labels, ('le', bound))))), 1),
+        ((f'{name}_sum', labels), value),
+        ((f'{name}_count', labels), 1),
+    )
+
+
+def record_request(route, method, status, duration, queries, size):
+    if not settings.METRICS_DIR:
+        return
+    labels = (('method', method), ('route', route))
+    get_store().add((
+        (
+            ('foodgram_requests_total', (*labels, ('status', str(status)))),
+            1
+        ),
+        *histogram_items('foodgram_request_duration_seconds', labels,
+                         duration, DURATION_BUCKETS),
+        *histogram_items('foodgram_request_queries', labels, queries,
+                         QUERY_BUCKETS),
+        *histogram_items('foodgram_response_size_bytes', labels, size,
+                         SIZE_BUCKETS),
+    ))
+
+
+def record_cache(cache, hits=0, misses=0):
+    if hits:
+        inc('foodgram_cache_requests_total',
+            {'cache': cache, 'outcome': 'hit'}, hits)
+    if misses:
+        inc('foodgram_cache_requests_total',
+            {'cache': cache, 'outcome': 'miss'}, misses)
+
+
+def collect_values():
+    """Суммирует значения из файлов всех процессов."""
+    totals = defaultdict(float)
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.db')):
+        with open(path, 'rb') as file:
+            data = file.read()
+        if len(data) < HEADER.size:
+            continue
+        used = HEADER.unpack_from(data, 0)[0]
+        for key, value, _ in read_entries(data, used):
+            totals[key] += value
+    return totals
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in sorted(labels.items())
+    )
+    return '{%s}' % ','.join(f'{name}="{value}"' for name, value in escaped)
+
+
+def sample_lines(name, samples):
+    for labels, value in samples:
+        yield f'{name}{format_labels(labels)} {float(value)!r}'
+
+
+def bucket_bound(labels):
+    bound = labels['le']
+    return float('inf') if bound == '+Inf' else float(bound)
+
+
+def cumulative_buckets(samples, buckets):
+    """Превращает счётчики по бакетам в накопленные, как требует формат."""
+    series = defaultdict(dict)
+    for labels, value in samples:
+        key = tuple(sorted(
+            (name, label) for name, label in labels.items() if name != 'le'
+        ))
+        series[key][bucket_bound(labels)] = value
+    for key, counts in series.items():
+        running = 0
+        for bound in (*buckets, float('inf')):
+            running += counts.get(bound, 0)
+            label = '+Inf' if bound == float('inf') else str(bound)
+            yield dict(key, le=label), running
+
+
+def render_metrics(totals):
+    samples = defaultdict(list)
+    for key, value in totals.items():
+        name, labels = json.loads(key)
+        samples[name].append((labels, value))
+    hits = defaultdict(float)
+    lookups = defaultdict(float)
+    for labels, value in samples['foodgram_cache_requests_total']:
+        lookups[labels['cache']] += value
+        if labels['outcome'] == 'hit':
+            hits[labels['cache']] += value
+    samples['foodgram_cache_hit_ratio'] = [
+        ({'cache': cache}, hits[cache] / total)
+        for cache, total in lookups.items() if total
+    ]
+    buckets = {
+        'foodgram_request_duration_seconds': DURATION_BUCKETS,
+        'foodgram_request_queries': QUERY_BUCKETS,
+        'foodgram_response_size_bytes': SIZE_BUCKETS,
+    }
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind != 'histogram':
+            lines.extend(sample_lines(name, sorted(
+                samples[name], key=lambda sample: sorted(sample[0].items())
+            )))
+            continue
+        lines.extend(sample_lines(f'{name}_bucket', cumulative_buckets(
+            samples[f'{name}_bucket'], buckets[name]
+        )))
+        for suffix in ('_sum', '_count'):
+            lines.extend(sample_lines(
+                f'{name}{suffix}', samples[f'{name}{suffix}']
+            ))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Отдаёт метрики по Bearer-токену METRICS_TOKEN. Если токен не задан,
+    эндпоинт закрыт и отвечает 404."""
+    if not settings.METRICS_TOKEN:
+        raise Http404
+    if not constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''),
+        f'Bearer {settings.METRICS_TOKEN}'
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render_metrics(collect_values()) if settings.METRICS_DIR else '',
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
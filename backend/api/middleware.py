@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .metrics import record_request
+from .profiling import (
+    HEADER, ProfileSession, profile_requested, save_profile
+)
+from .timing import RequestMetrics, current_metrics
+
+slow_log = logging.getLogger('foodgram.slow_requests')
+
+SLOW_LOG_STATEMENTS = 20
+
+
+def enter_context(factory):
+    """Создаёт контекст и входит в него в текущем потоке.
+
+    Под ASGI синхронные части запроса выполняются в отдельном потоке со
+    своим соединением с БД, поэтому вход и выход из контекстов,
+    привязанных к потоку, выполняются там же через sync_to_async.
+    """
+    context = factory()
+    context.__enter__()
+    return context
+
+
+async def exit_context(context):
+    await sync_to_async(context.__exit__)(None, None, None)
+
+
+class AsyncCapableMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Так Django распознаёт middleware как асинхронный.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return self.handle(request)
+
+
+class RequestTimingMiddleware(AsyncCapableMiddleware):
+    """Замеряет SQL, сериализацию, рендеринг и общее время запроса.
+
+    При SERVER_TIMING метрики отдаются в заголовке Server-Timing. Запросы
+    дольше SLOW_REQUEST_MS миллисекунд пишутся в лог
+    foodgram.slow_requests с нормализованными SQL-запросами, сгруппированными
+    по тексту. При METRICS_DIR время, число SQL-запросов и размер ответа
+    попадают в метрики Prometheus. Если всё выключено, middleware не
+    подключается.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.server_timing = settings.SERVER_TIMING
+        self.slow_request_ms = settings.SLOW_REQUEST_MS
+        self.metrics = bool(settings.METRICS_DIR)
+        if (not self.server_timing and self.slow_request_ms is None
+                and not self.metrics):
+            raise MiddlewareNotUsed
+
+    def handle(self, request):
+        metrics = self.start()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = self.start()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def start(self):
+        return RequestMetrics(capture_sql=self.slow_request_ms is not None)
+
+    def finish(self, request, response, metrics):
+        total = metrics.total()
+        if self.server_timing:
+            response['Server-Timing'] = self.server_timing_header(
+                metrics, total
+            )
+        if (self.slow_request_ms is not None
+                and total * 1000 >= self.slow_request_ms):
+            self.log_slow_request(request, response, metrics, total)
+        if self.metrics:
+            self.record(request, response, metrics, total)
+        return response
+
+    def process_template_response(self, request, response):
+        metrics = current_metrics.get()
+        if metrics is not None:
+            started = metrics.total()
+            response.add_post_render_callback(
+                lambda rendered: metrics.add(
+                    'render', metrics.total() - started
+                )
+            )
+        return response
+
+    def record(self, request, response, metrics, total):
+        match = request.resolver_match
+        record_request(
+            match.url_name or match.view_name if match else 'unmatched',
+            request.method, response.status_code, total, metrics.sql_count,
+            0 if response.streaming else len(response.content)
+        )
+
+    def server_timing_header(self, metrics, total):
+        parts = [
+            f'db;dur={metrics.sql_time * 1000:.1f};'
+            f'desc="{metrics.sql_count} queries"'
+        ]
+        parts.extend(
+            f'{name};dur={seconds * 1000:.1f}'
+            for name, seconds in metrics.durations.items()
+        )
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+    def log_slow_request(self, request, response, metrics, total):
+        record = {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'sql_ms': round(metrics.sql_time * 1000, 1),
+            'sql_count': metrics.sql_count,
+        }
+        record.update(
+            (f'{name}_ms', round(seconds * 1000, 1))
+            for name, seconds in metrics.durations.items()
+        )
+        record['queries'] = metrics.grouped_statements(SLOW_LOG_STATEMENTS)
+        slow_log.warning(json.dumps(record, ensure_ascii=False))
+
+
+class RequestProfilerMiddleware(AsyncCapableMiddleware):
+    """Профилирует запрос cProfile по заголовку X-Profile.
+
+    Подключается, только если задан PROFILE_DIR. Id сохранённого профиля
+    возвращается в заголовке X-Profile-Id.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if not settings.PROFILE_DIR:
+            raise MiddlewareNotUsed
+
+    def handle(self, request):
+        if not profile_requested(request):
+            return self.get_response(request)
+        session = ProfileSession()
+        started = time.perf_counter()
+        with session.run():
+            response = self.get_response(request)
+        return self.finish(session, request, response, started)
+
+    async def __acall__(self, request):
+        # Проверка токена обращается к БД, поэтому без заголовка запрос
+        # не уходит в поток.
+        if not (request.META.get(HEADER)
+                and await sync_to_async(profile_requested)(request)):
+            return await self.get_response(request)
+        session = ProfileSession()
+        started = time.perf_counter()
+        with session.sampling():
+            profiling = await sync_to_async(enter_context)(
+                session.profile_thread
+            )
+            try:
+                response = await self.get_response(request)
+            finally:
+                await exit_context(profiling)
+        return await sync_to_async(self.finish)(
+            session, request, response, started
+        )
+
+    def finish(self, session, request, response, started):
+        meta = save_profile(
+            session, request, response, time.perf_counter() - started
+        )
+        response['X-Profile-Id'] = meta['id']
+        return response
@@ -0,0 +1,221 @@
+"""Профилирование отдельных запросов по требованию.
+
+Запрос профилируется, если в нём есть заголовок X-Profile: значение «1»
+от администратора или подпись из команды sign_profile_header. Результат —
+файлы <id>.pstats, <id>.collapsed (стеки для flamegraph, собранные
+выборками раз в PROFILE_SAMPLE_INTERVAL секунд) и <id>.json
+с описанием запроса в PROFILE_DIR; хранятся последние PROFILE_RETENTION
+профилей.
+"""
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import uuid
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+
+from users.authentication import CachedTokenAuthentication
+
+HEADER = 'HTTP_X_PROFILE'
+SIGNATURE_SALT = 'foodgram.profile'
+FILE_KINDS = ('pstats', 'collapsed')
+
+current_session = ContextVar('profile_session', default=None)
+
+
+def sign_header():
+    return signing.TimestampSigner(salt=SIGNATURE_SALT).sign(
+        uuid.uuid4().hex
+    )
+
+
+def is_admin(request):
+    user = request.user
+    if not user.is_authenticated:
+        try:
+            authenticated = CachedTokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        if authenticated is None:
+            return False
+        user = authenticated[0]
+    return user.is_admin
+
+
+def profile_requested(request):
+    value = request.META.get(HEADER)
+    if not value:
+        return False
+    if value == '1':
+        return is_admin(request)
+    try:
+        signing.TimestampSigner(salt=SIGNATURE_SALT).unsign(
+            value, max_age=settings.PROFILE_SIGNATURE_MAX_AGE
+        )
+    except signing.BadSignature:
+        return False
+    return True
+
+
+class StackSampler(threading.Thread):
+    """Раз в interval секунд снимает стеки потоков запроса.
+
+    cProfile хранит только пары «вызывающий — вызываемый», и рекурсивная
+    цепочка middleware в них не восстанавливается, поэтому стеки для
+    flamegraph собираются выборками.
+    """
+
+    def __init__(self, interval):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.interval = interval
+        self.threads = set()
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in tuple(self.threads):
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[stack_key(frame)] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def collapsed(self):
+        """Стеки в формате «a;b;c число_выборок» для flamegraph.pl и
+        speedscope."""
+        return ''.join(
+            f'{stack} {samples}\n'
+            for stack, samples in sorted(self.stacks.items())
+        )
+
+
+def stack_key(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(
+            f'{code.co_name} ({os.path.basename(code.co_filename)}:'
+            f'{code.co_firstlineno})'.replace(';', ',')
+        )
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class ProfileSession:
+    """cProfile для каждого потока запроса и общий сборщик стеков."""
+
+    def __init__(self):
+        self.profiles = []
+        self.sampler = StackSampler(settings.PROFILE_SAMPLE_INTERVAL)
+
+    @contextmanager
+    def profile_thread(self):
+        """Профилирует блок в текущем потоке; cProfile видит только его."""
+        ident = threading.get_ident()
+        profiler = cProfile.Profile()
+        self.sampler.threads.add(ident)
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self.sampler.threads.discard(ident)
+            self.profiles.append(profiler)
+
+    @contextmanager
+    def sampling(self):
+        """Делает сессию текущей и собирает стеки её потоков."""
+        token = current_session.set(self)
+        self.sampler.start()
+        try:
+            yield
+        finally:
+            self.sampler.stop()
+            current_session.reset(token)
+
+    @contextmanager
+    def run(self):
+        with self.sampling(), self.profile_thread():
+            yield
+
+
+def profile_pool_thread():
+    """Для представлений, которые concurrency выполняет в пуле потоков."""
+    session = current_session.get()
+    if session is None:
+        return nullcontext()
+    return session.profile_thread()
+
+
+def profile_path(profile_id, kind):
+    return os.path.join(settings.PROFILE_DIR, f'{profile_id}.{kind}')
+
+
+def save_profile(session, request, response, duration):
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    now = timezone.now()
+    profile_id = f'{now:%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:4]}'
+    pstats.Stats(*session.profiles).dump_stats(
+        profile_path(profile_id, 'pstats')
+    )
+    with open(profile_path(profile_id, 'collapsed'), 'w') as file:
+        file.write(session.sampler.collapsed())
+    match = request.resolver_match
+    meta = {
+        'id': profile_id,
+        'created': now.isoformat(),
+        'method': request.method,
+        'path': request.get_full_path(),
+        'endpoint': match.url_name if match else None,
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 1),
+        'samples': sum(session.sampler.stacks.values()),
+    }
+    with open(profile_path(profile_id, 'json'), 'w') as file:
+        json.dump(meta, file, ensure_ascii=False)
+    prune_profiles()
+    return meta
+
+
+def profile_ids():
+    """Id сохранённых профилей, от новых к старым."""
+    if not settings.PROFILE_DIR or not os.path.isdir(settings.PROFILE_DIR):
+        return []
+    return sorted(
+        (name[:-len('.json')] for name in os.listdir(settings.PROFILE_DIR)
+         if name.endswith('.json')),
+        reverse=True
+    )
+
+
+def prune_profiles():
+    for profile_id in profile_ids()[settings.PROFILE_RETENTION:]:
+        for kind in ('json', *FILE_KINDS):
+            try:
+                os.remove(profile_path(profile_id, kind))
+            except FileNotFoundError:
+                pass
+
+
+def load_profiles():
+    profiles = []
+    for profile_id in profile_ids():
+        try:
+            with open(profile_path(profile_id, 'json')) as file:
+                profiles.append(json.load(file))
+        except (FileNotFoundError, ValueError):
+            continue
+    return profiles
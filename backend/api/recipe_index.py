@@ -0,0 +1,284 @@
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from itertools import groupby
+from operator import itemgetter
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from foodgram.models import Amount, Recipe
+from foodgram.signals import recipes_changed
+
+SEQ_KEY = 'ingredient_recipe_index_seq'
+CHANGE_KEY = 'ingredient_recipe_index_change:{}'
+CHANGE_TIMEOUT = 60 * 60
+# Сколько изменений применяется по журналу; при большем отставании индекс
+# перестраивается целиком.
+MAX_CHANGES = 500
+# Больше рецептов в одном изменении (массовая загрузка) — полная
+# перестройка вместо чтения их ингредиентов.
+MAX_CHANGE_RECIPES = 500
+# Результат индекса длиннее передаётся в ленту подзапросом, а не списком
+# pk__in: SQLite ограничивает число параметров, а длинный IN медленнее
+# соединения с Amount.
+MAX_INLINE_IDS = 500
+
+logger = logging.getLogger(__name__)
+
+
+def query_with_all(ingredient_ids):
+    ingredient_ids = set(ingredient_ids)
+    return Recipe.objects.filter(
+        ingredient_amount__ingredient__in=ingredient_ids
+    ).annotate(
+        matched=Count('ingredient_amount')
+    ).filter(matched=len(ingredient_ids)).values_list('id', flat=True)
+
+
+def query_with_any(ingredient_ids):
+    return Recipe.objects.filter(
+        ingredient_amount__ingredient__in=set(ingredient_ids)
+    ).values_list('id', flat=True)
+
+
+def query_missing_at_most(ingredient_ids, missing):
+    return Recipe.objects.annotate(
+        total=Count('ingredient_amount'),
+        matched=Count(
+            'ingredient_amount',
+            filter=Q(ingredient_amount__ingredient__in=set(ingredient_ids))
+        )
+    ).filter(
+        matched__gt=0, total__lte=F('matched') + missing
+    ).values_list('id', flat=True)
+
+
+def ids_or_query(recipe_ids, query):
+    """Значение для фильтра pk__in: id из индекса или подзапрос."""
+    if len(recipe_ids) <= MAX_INLINE_IDS:
+        return recipe_ids
+    return query
+
+
+class IngredientRecipeIndex:
+    """Инвертированный индекс «ингредиент → id рецептов» в памяти процесса.
+
+    Для каждого ингредиента хранится отсортированный массив id рецептов,
+    для каждого рецепта — кортеж его ингредиентов. Первый запрос строит
+    индекс одним проходом по Amount. Дальше процессы получают изменения из
+    журнала в общем кэше: запись с номером SEQ_KEY содержит новые наборы
+    ингредиентов изменённых рецептов, и индекс правит только их. Если
+    журнал потерян или процесс отстал больше чем на MAX_CHANGES записей,
+    индекс перестраивается в фоновом потоке, а запросы до окончания
+    перестроения читают предыдущую версию.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seq = None
+        self._rebuilding = False
+        # Индекс и ингредиенты рецептов заменяются одним присваиванием,
+        # чтобы читатели не видели их из разных построений.
+        self._data = ({}, {})
+
+    def _build(self):
+        cache.add(SEQ_KEY, 0, None)
+        seq = cache.get(SEQ_KEY)
+        rows = Amount.objects.order_by(
+            'ingredient_id', 'recipe_id'
+        ).values_list('ingredient_id', 'recipe_id').iterator()
+        postings = {}
+        recipes = defaultdict(list)
+        for ingredient_id, group in groupby(rows, key=itemgetter(0)):
+            recipe_ids = array('q', map(itemgetter(1), group))
+            postings[ingredient_id] = recipe_ids
+            for recipe_id in recipe_ids:
+                recipes[recipe_id].append(ingredient_id)
+        self._data = (postings, {
+            recipe_id: tuple(ingredient_ids)
+            for recipe_id, ingredient_ids in recipes.items()
+        })
+        self._seq = seq
+
+    def _rebuild(self):
+        try:
+            self._build()
+        except Exception:
+            logger.exception('Не удалось перестроить индекс рецептов')
+        finally:
+            self._rebuilding = False
+            connection.close()
+
+    def _start_rebuild(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(
+            target=self._rebuild, name='recipe-index', daemon=True
+        ).start()
+
+    def _apply(self, changes):
+        postings, recipes = self._data
+        for change in changes:
+            for recipe_id, ingredient_ids in change.items():
+                old = set(recipes.pop(recipe_id, ()))
+                new = set(ingredient_ids)
+                for ingredient_id in old - new:
+                    posting = postings[ingredient_id]
+                    position = bisect_left(posting, recipe_id)
+                    # Массив заменяется копией: читатели в других потоках
+                    # могут в этот момент по нему итерироваться.
+                    postings[ingredient_id] = (
+                        posting[:position] + posting[position + 1:]
+                    )
+                for ingredient_id in new - old:
+                    posting = postings.get(ingredient_id, array('q'))
+                    position = bisect_left(posting, recipe_id)
+                    postings[ingredient_id] = (
+                        posting[:position] + array('q', [recipe_id])
+                        + posting[position:]
+                    )
+                if ingredient_ids:
+                    recipes[recipe_id] = tuple(ingredient_ids)
+
+    def _catch_up(self):
+        """Применяет новые записи журнала или запускает перестроение."""
+        seq = cache.get(SEQ_KEY)
+        if seq == self._seq or self._rebuilding:
+            return
+        if seq is None or seq < self._seq or seq - self._seq > MAX_CHANGES:
+            self._start_rebuild()
+            return
+        with self._lock:
+            if self._rebuilding or seq <= self._seq:
+                return
+            keys = [
+                CHANGE_KEY.format(number)
+                for number in range(self._seq + 1, seq + 1)
+            ]
+            changes = cache.get_many(keys)
+            complete = (
+                len(changes) == len(keys) and None not in changes.values()
+            )
+            if complete:
+                self._apply(changes[key] for key in keys)
+                self._seq = seq
+        if not complete:
+            self._start_rebuild()
+
+    def _ensure_built(self):
+        """Возвращает индекс и ингредиенты рецептов."""
+        if self._seq is None:
+            with self._lock:
+                if self._seq is None:
+                    self._build()
+        else:
+            self._catch_up()
+        return self._data
+
+    def record_changes(self, recipe_ids):
+        """Записывает в журнал текущие наборы ингредиентов рецептов."""
+        recipe_ids = set(recipe_ids)
+        if not recipe_ids:
+            return
+        if len(recipe_ids) > MAX_CHANGE_RECIPES:
+            change = None
+        else:
+            change = dict.fromkeys(recipe_ids, ())
+            rows = Amount.objects.filter(recipe_id__in=recipe_ids).order_by(
+                'recipe_id', 'ingredient_id'
+            ).values_list('recipe_id', 'ingredient_id')
+            for recipe_id, group in groupby(rows, key=itemgetter(0)):
+                change[recipe_id] = tuple(map(itemgetter(1), group))
+        try:
+            seq = cache.incr(SEQ_KEY)
+        except ValueError:
+            # Счётчика нет: процессы увидят seq меньше своего и перестроят
+            # индекс целиком.
+            cache.add(SEQ_KEY, 0, None)
+            seq = cache.incr(SEQ_KEY)
+        cache.set(CHANGE_KEY.format(seq), change, CHANGE_TIMEOUT)
+
+    def with_all(self, ingredient_ids):
+        """Рецепты, в которых есть все перечисленные ингредиенты."""
+        index, _ = self._ensure_built()
+        postings = sorted(
+            (index.get(pk, ()) for pk in set(ingredient_ids)), key=len
+        )
+        if not postings:
+            return set()
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result.intersection_update(posting)
+            if not result:
+                break
+        return result
+
+    def with_any(self, ingredient_ids):
+        """Рецепты, в которых есть хотя бы один из ингредиентов."""
+        index, _ = self._ensure_built()
+        result = set()
+        for pk in set(ingredient_ids):
+            result.update(index.get(pk, ()))
+        return result
+
+    def missing_at_most(self, ingredient_ids, missing):
+        """Рецепты, для которых не хватает не больше missing ингредиентов.
+
+        Учитываются рецепты, где есть хотя бы один из ingredient_ids.
+        """
+        index, recipes = self._ensure_built()
+        matched = Counter()
+        for pk in set(ingredient_ids):
+            matched.update(index.get(pk, ()))
+        return {
+            recipe_id for recipe_id, count in matched.items()
+            if len(recipes.get(recipe_id, ())) - count <= missing
+        }
+
+
+ingredient_recipe_index = IngredientRecipeIndex()
+
+_pending = threading.local()
+
+
+def flush_changes():
+    recipe_ids = getattr(_pending, 'recipe_ids', None)
+    if recipe_ids:
+        _pending.recipe_ids = set()
+        ingredient_recipe_index.record_changes(recipe_ids)
+
+
+def schedule_changes(recipe_ids):
+    """Копит id рецептов до фиксации транзакции и записывает их одним
+    изменением. Первый из обработчиков on_commit забирает всё накопленное,
+    остальные ничего не делают. Id из отменённой транзакции уйдут со
+    следующей и лишь повторно прочитают актуальные ингредиенты."""
+    if not hasattr(_pending, 'recipe_ids'):
+        _pending.recipe_ids = set()
+    _pending.recipe_ids.update(recipe_ids)
+    transaction.on_commit(flush_changes)
+
+
+@receiver(post_save, sender=Amount)
+@receiver(post_delete, sender=Amount)
+def record_amount_change(sender, instance, **kwargs):
+    schedule_changes([instance.recipe_id])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def record_recipe_change(sender, instance, **kwargs):
+    schedule_changes([instance.pk])
+
+
+@receiver(recipes_changed)
+def record_recipes_change(sender, recipe_ids, **kwargs):
+    schedule_changes(recipe_ids)
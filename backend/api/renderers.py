@@ -0,0 +1,50 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS
+    | orjson.OPT_PASSTHROUGH_DATETIME
+    | orjson.OPT_PASSTHROUGH_DATACLASS
+    if orjson is not None else 0
+)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer, который кодирует ответ через orjson, если он установлен.
+
+    Дата и время, ленивые строки и прочие типы, которые orjson не знает или
+    кодирует иначе, передаются в JSONEncoder из DRF, поэтому байты ответа
+    совпадают с JSONRenderer. Исключение — экспоненциальная запись чисел
+    с плавающей точкой: orjson пишет 1e-7 и 1e16 вместо 1e-07 и 1e+16.
+    Отступы по запросу и всё, что orjson закодировать не смог,
+    обрабатываются обычным JSONRenderer.
+    """
+
+    def can_use_orjson(self, accepted_media_type, renderer_context):
+        return (
+            orjson is not None
+            and self.compact
+            and self.strict
+            and not self.ensure_ascii
+            and self.get_indent(accepted_media_type, renderer_context) is None
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or not self.can_use_orjson(
+            accepted_media_type, renderer_context or {}
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=ORJSON_OPTIONS
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return content.replace(
+            b'\xe2\x80\xa8', b'\\u2028'
+        ).replace(b'\xe2\x80\xa9', b'\\u2029')
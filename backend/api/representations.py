@@ -0,0 +1,125 @@
+"""Быстрое построение ответов для списков без полей сериализаторов DRF.
+
+Словари собираются напрямую из строк .values() и уже загруженных
+объектов; ключи и типы значений совпадают с выводом соответствующих
+сериализаторов и со схемой в docs/openapi-schema.yml.
+"""
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+
+from foodgram.models import Amount, Recipe
+
+USER_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+SUBSCRIPTION_FIELDS = ('id', 'email', 'username', 'first_name', 'last_name')
+TAG_FIELDS = ('id', 'name', 'color', 'slug')
+INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit')
+
+
+def file_url(request, name):
+    """Как FileField.to_representation в DRF: абсолютный URL или None."""
+    if not name:
+        return None
+    url = default_storage.url(name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def image_variants(request, variants):
+    return {
+        width: {
+            extension: file_url(request, path)
+            for extension, path in formats.items()
+        }
+        for width, formats in variants.items()
+    }
+
+
+def user_dict(user, is_subscribed, fields=USER_FIELDS):
+    data = {field: getattr(user, field) for field in fields}
+    data['is_subscribed'] = is_subscribed
+    return data
+
+
+def user_rows(rows, follows):
+    """Пользователи из строк .values(*USER_FIELDS)."""
+    return [dict(row, is_subscribed=row['id'] in follows) for row in rows]
+
+
+def recipe_fragments(recipes, request):
+    """Представления рецептов без флагов пользователя: {id: словарь}.
+
+    Теги и ингредиенты читаются двумя запросами .values() на всю пачку.
+    """
+    ids = [recipe.pk for recipe in recipes]
+    tags = defaultdict(list)
+    for row in Recipe.tags.through.objects.filter(
+        recipe_id__in=ids
+    ).order_by('id').values(
+        'recipe_id', *(f'tag__{field}' for field in TAG_FIELDS)
+    ):
+        tags[row['recipe_id']].append(
+            {field: row[f'tag__{field}'] for field in TAG_FIELDS}
+        )
+    ingredients = defaultdict(list)
+    for row in Amount.objects.filter(recipe_id__in=ids).order_by('id').values(
+        'recipe_id', 'amount',
+        *(f'ingredient__{field}' for field in INGREDIENT_FIELDS)
+    ):
+        ingredient = {
+            field: row[f'ingredient__{field}'] for field in INGREDIENT_FIELDS
+        }
+        ingredient['amount'] = row['amount']
+        ingredients[row['recipe_id']].append(ingredient)
+    return {
+        recipe.pk: {
+            'id': recipe.pk,
+            'tags': tags[recipe.pk],
+            'author': user_dict(recipe.author, False),
+            'ingredients': ingredients[recipe.pk],
+            'is_favorited': False,
+            'is_in_shopping_cart': False,
+            'name': recipe.name,
+            'image': file_url(request, recipe.image.name),
+            'image_variants': image_variants(request, recipe.image_variants),
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+        }
+        for recipe in recipes
+    }
+
+
+def with_user_flags(fragment, membership):
+    """Копия фрагмента рецепта с флагами текущего пользователя."""
+    data = fragment.copy()
+    data['is_favorited'] = data['id'] in membership['favorites']
+    data['is_in_shopping_cart'] = data['id'] in membership['cart']
+    data['author'] = fragment['author'].copy()
+    data['author']['is_subscribed'] = (
+        data['author']['id'] in membership['follows']
+    )
+    return data
+
+
+def short_recipe(recipe):
+    """Как FollowRecipeSerializer, которому не передаётся request."""
+    return {
+        'id': recipe.pk,
+        'name': recipe.name,
+        'image': file_url(None, recipe.image.name),
+        'cooking_time': recipe.cooking_time,
+    }
+
+
+def subscription_rows(follows):
+    """Подписки из Follow.objects.with_recipes(): автор и его рецепты."""
+    rows = []
+    for follow in follows:
+        data = user_dict(follow.author, True, SUBSCRIPTION_FIELDS)
+        data['recipes'] = [
+            short_recipe(recipe) for recipe in follow.author.limited_recipes
+        ]
+        data['recipes_count'] = follow.author.recipes_count
+        rows.append(data)
+    return rows
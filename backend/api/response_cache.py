@@ -0,0 +1,269 @@
+"""Кэш ответов ленты рецептов для анонимных пользователей.
+
+Запись хранит готовое тело ответа и набор меток: рецепты, авторы и теги,
+которые в нём встречаются, плюс общая метка списка. У каждой метки в кэше
+лежит время последнего изменения; запись действительна, пока ни одна из
+её меток не менялась после того, как запись начали строить. Поэтому
+изменение рецепта сбрасывает только страницы, где этот рецепт есть, и
+страницы с фильтрами: после правки рецепт может начать им соответствовать.
+Страницы с ordering не кэшируются: счётчики, по которым идёт сортировка,
+меняются через queryset.update() без сигналов.
+Бэкенд задаётся алиасом RESPONSE_CACHE_ALIAS в CACHES.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+from foodgram.models import Amount, Ingredient, Recipe, Tag
+from foodgram.signals import recipes_changed, reference_data_changed
+from users.models import User
+
+from .metrics import record_cache
+
+ENTRY_KEY = 'response:{}'
+TAG_KEY = 'response_tag:{}'
+STATS_KEY = 'response_stats:{}'
+LIST_TAG = 'recipe-list'
+FILTERED_LIST_TAG = 'recipe-list-filtered'
+PAGE_PARAMS = ('page', 'limit', 'cursor')
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def normalize_query(query_params):
+    return '&'.join(
+        f'{name}={value}'
+        for name in sorted(query_params)
+        for value in sorted(query_params.getlist(name))
+        if value != ''
+    )
+
+
+def entry_key(request):
+    raw = '{}|{}|{}|{}?{}'.format(
+        request.scheme, request.get_host(), request.accepted_media_type,
+        request.path,
+        normalize_query(request.query_params)
+    )
+    return ENTRY_KEY.format(hashlib.md5(raw.encode()).hexdigest())
+
+
+def recipe_tags(recipe):
+    yield f'recipe:{recipe["id"]}'
+    yield f'author:{recipe["author"]["id"]}'
+    for tag in recipe['tags']:
+        yield f'tag:{tag["id"]}'
+
+
+def is_filtered(request):
+    return any(
+        name not in PAGE_PARAMS and any(values)
+        for name, values in request.query_params.lists()
+    )
+
+
+def collect_tags(data, filtered=False):
+    if 'results' in data:
+        tags = {LIST_TAG}
+        if filtered:
+            tags.add(FILTERED_LIST_TAG)
+        for recipe in data['results']:
+            tags.update(recipe_tags(recipe))
+        return tags
+    return set(recipe_tags(data))
+
+
+def count(outcome):
+    record_cache('responses', outcome == 'hit', outcome == 'miss')
+    cache = get_cache()
+    key = STATS_KEY.format(outcome)
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, None)
+
+
+def get_stats():
+    cache = get_cache()
+    return {
+        outcome: cache.get(STATS_KEY.format(outcome), 0)
+        for outcome in ('hit', 'miss')
+    }
+
+
+def reset_stats():
+    get_cache().delete_many(
+        [STATS_KEY.format(outcome) for outcome in ('hit', 'miss')]
+    )
+
+
+def is_cacheable(request):
+    return (
+        request.method == 'GET'
+        and not request.user.is_authenticated
+        and request.accepted_renderer.format == 'json'
+        and 'ordering' not in request.query_params
+    )
+
+
+def tag_keys(entries):
+    return {TAG_KEY.format(tag) for entry in entries for tag in entry['tags']}
+
+
+def is_fresh(entry, versions):
+    """Запись свежая, если ни одна её метка не менялась после начала
+    построения записи. Метка без времени считается изменённой."""
+    for tag in entry['tags']:
+        version = versions.get(TAG_KEY.format(tag))
+        if version is None or version >= entry['started']:
+            return False
+    return True
+
+
+def lookup(key):
+    cache = get_cache()
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    if not is_fresh(entry, cache.get_many(tag_keys([entry]))):
+        return None
+    return entry
+
+
+def store_many(entries, timeout):
+    """Сохраняет записи {ключ: запись}, пропуская уже устаревшие."""
+    cache = get_cache()
+    keys = tag_keys(entries.values())
+    versions = cache.get_many(keys)
+    for key in keys - versions.keys():
+        if cache.add(key, 0, None):
+            versions[key] = 0
+        else:
+            versions[key] = cache.get(key)
+    cache.set_many({
+        key: entry for key, entry in entries.items()
+        if is_fresh(entry, versions)
+    }, timeout)
+
+
+def cached_response(view, request, get_response):
+    """Отдаёт ответ из кэша или строит его через get_response и сохраняет.
+    """
+    if not is_cacheable(request):
+        return get_response()
+    key = entry_key(request)
+    entry = lookup(key)
+    if entry is not None:
+        count('hit')
+        response = HttpResponse(
+            entry['content'], content_type=entry['content_type']
+        )
+        response['X-Cache'] = 'HIT'
+        return response
+    count('miss')
+    started = time.time_ns()
+    response = get_response()
+    if response.status_code != 200:
+        return response
+    renderer = request.accepted_renderer
+    content_type = request.accepted_media_type
+    if renderer.charset:
+        content_type = f'{content_type}; charset={renderer.charset}'
+    entry = {
+        'content': renderer.render(
+            response.data, request.accepted_media_type,
+            view.get_renderer_context()
+        ),
+        'content_type': content_type,
+        'tags': collect_tags(response.data, is_filtered(request)),
+        'started': started,
+    }
+    store_many({key: entry}, settings.RESPONSE_CACHE_TIMEOUT)
+    response = HttpResponse(
+        entry['content'], content_type=entry['content_type']
+    )
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+def invalidate(*tags):
+    """Помечает метки изменёнными после фиксации транзакции."""
+    def bump():
+        now = time.time_ns()
+        get_cache().set_many(
+            {TAG_KEY.format(tag): now for tag in tags}, None
+        )
+    transaction.on_commit(bump)
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_recipe(sender, instance, created, **kwargs):
+    if created:
+        invalidate(LIST_TAG, f'recipe:{instance.pk}')
+    else:
+        invalidate(FILTERED_LIST_TAG, f'recipe:{instance.pk}')
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_deleted_recipe(sender, instance, **kwargs):
+    invalidate(LIST_TAG, f'recipe:{instance.pk}')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(sender, instance, reverse, pk_set, **kwargs):
+    if reverse:
+        recipe_ids, tag_ids = pk_set or (), [instance.pk]
+    else:
+        recipe_ids, tag_ids = [instance.pk], pk_set or ()
+    invalidate(
+        FILTERED_LIST_TAG,
+        *(f'recipe:{pk}' for pk in recipe_ids),
+        *(f'tag:{pk}' for pk in tag_ids)
+    )
+
+
+@receiver(post_save, sender=Amount)
+@receiver(post_delete, sender=Amount)
+def invalidate_amount(sender, instance, **kwargs):
+    invalidate(FILTERED_LIST_TAG, f'recipe:{instance.recipe_id}')
+
+
+@receiver(recipes_changed)
+def invalidate_recipes(sender, recipe_ids, **kwargs):
+    invalidate(LIST_TAG, *(f'recipe:{pk}' for pk in recipe_ids))
+
+
+@receiver(post_save, sender=Ingredient)
+def invalidate_ingredient(sender, instance, created, **kwargs):
+    if not created:
+        invalidate(FILTERED_LIST_TAG, *(
+            f'recipe:{pk}' for pk in Amount.objects.filter(
+                ingredient=instance
+            ).values_list('recipe_id', flat=True)
+        ))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag(sender, instance, **kwargs):
+    invalidate(FILTERED_LIST_TAG, f'tag:{instance.pk}')
+
+
+@receiver(reference_data_changed, sender=Tag)
+def invalidate_loaded_tags(sender, updated_ids, **kwargs):
+    invalidate(FILTERED_LIST_TAG, *(f'tag:{pk}' for pk in updated_ids))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_author(sender, instance, **kwargs):
+    invalidate(f'author:{instance.pk}')
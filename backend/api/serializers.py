@@ -1,15 +1,24 @@
+import json
+
 from drf_extra_fields.fields import Base64ImageField
 
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 from rest_framework.validators import UniqueTogetherValidator
 
+from foodgram.images import schedule_image_processing
 from foodgram.models import (Recipe, Tag, Ingredient,
                              Amount, Favorite, Cart, Follow)
 from users.models import User
 from users.serializers import CustomUserSerializer
+from .fragments import get_fragments
+from .membership import get_membership
+from .representations import image_variants, with_user_flags
+from .timing import measure
+from .uploads import RecipeImageField
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -36,50 +45,69 @@ class AmountSerializer(serializers.ModelSerializer):
         ]
 
 
+class IngredientAmountSerializer(serializers.ModelSerializer):
+    """Ингредиент рецепта во входных данных: id и количество."""
+    id = serializers.IntegerField()
+
+    class Meta:
+        model = Amount
+        fields = ('id', 'amount',)
+
+
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ('id', 'name', 'color', 'slug',)
 
 
-class RecipeListSerializer(serializers.ModelSerializer):
-    image = Base64ImageField()
-    ingredients = SerializerMethodField()
-    tags = TagSerializer(many=True)
-    author = CustomUserSerializer(read_only=True)
-    is_favorited = SerializerMethodField()
-    is_in_shopping_cart = SerializerMethodField()
+class ImageVariantsMixin(serializers.Serializer):
+    image_variants = SerializerMethodField()
 
-    class Meta:
-        model = Recipe
-        fields = (
-            'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time',
-        )
+    def get_image_variants(self, obj):
+        return image_variants(self.context.get('request'), obj.image_variants)
 
-    def get_ingredients(self, obj):
-        return AmountSerializer(
-            Amount.objects.filter(recipe=obj), many=True
-        ).data
 
-    def get_is_favorited(self, obj):
-        if self.context['request'].user.is_authenticated and (
-                Favorite.objects.filter(
-                    user=self.context['request'].user, recipe=obj
-                                        ).exists()):
-            return True
-        return False
+class RecipeFragmentListSerializer(serializers.ListSerializer):
+    """Собирает страницу рецептов из кэшированных фрагментов."""
 
-    def get_is_in_shopping_cart(self, obj):
-        if self.context['request'].user.is_authenticated and (
-                Cart.objects.filter(
-                    user=self.context['request'].user, recipe=obj).exists()):
-            return True
-        return False
+    def to_representation(self, data):
+        recipes = list(data.all() if hasattr(data, 'all') else data)
+        with measure('serialize'):
+            fragments = get_fragments(
+                recipes, self.context.get('request'),
+                self.context.get('started')
+            )
+            membership = get_membership(self.context['request'].user)
+            return [
+                with_user_flags(fragments[recipe.pk], membership)
+                for recipe in recipes
+            ]
 
 
-class RecipeCreateSerializer(serializers.ModelSerializer):
-    image = Base64ImageField()
+class RecipeListSerializer(serializers.BaseSerializer):
+    """Рецепт для чтения: фрагмент из кэша и флаги текущего пользователя.
+
+    Состав полей задаёт representations.recipe_fragments.
+    """
+
+    class Meta:
+        list_serializer_class = RecipeFragmentListSerializer
+
+    def to_representation(self, instance):
+        with measure('serialize'):
+            fragments = get_fragments(
+                [instance], self.context.get('request'),
+                self.context.get('started')
+            )
+            return with_user_flags(
+                fragments[instance.pk],
+                get_membership(self.context['request'].user)
+            )
+
+
+class RecipeCreateSerializer(ImageVariantsMixin,
+                             serializers.ModelSerializer):
+    image = RecipeImageField()
     ingredients = SerializerMethodField()
     tags = SerializerMethodField()
     author = CustomUserSerializer(read_only=True)
@@ -88,50 +116,140 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients',
-            'name', 'image', 'text', 'cooking_time',
+            'name', 'image', 'image_variants', 'text', 'cooking_time',
         )
 
-    def create(self, validate_data):
-        ingredients = self.initial_data.get('ingredients')
-        tags = self.initial_data.get('tags')
-        recipe = Recipe.objects.create(**validate_data)
-        for tag in tags:
-            tag_object = Tag.objects.get(id=tag)
-            recipe.tags.add(tag_object)
-        for ingredient in ingredients:
-            ingredient_id = ingredient.get('id')
-            ing = Ingredient.objects.get(id=ingredient_id)
-            amount = ingredient.get('amount')
-            Amount.objects.create(
-                recipe=recipe,
-                ingredient=ing,
-                amount=amount
+    @staticmethod
+    def get_objects(name, model, ids):
+        if not isinstance(ids, list):
+            raise serializers.ValidationError({name: 'Ожидается список'})
+        try:
+            ids = [int(pk) for pk in ids]
+        except (TypeError, ValueError):
+            raise serializers.ValidationError(
+                {name: 'Идентификаторы должны быть целыми числами'}
+            )
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError({
+                name: f'Повторяющиеся идентификаторы: '
+                      f'{model._meta.verbose_name}'
+            })
+        objects = model.objects.in_bulk(ids)
+        missing = set(ids) - set(objects)
+        if missing:
+            raise serializers.ValidationError({
+                name: f'Не найдены объекты {model._meta.verbose_name}: '
+                      f'{sorted(missing)}'
+            })
+        return objects
+
+    def get_initial_list(self, name):
+        """Список из JSON-тела или из полей multipart/form-data.
+
+        В форме список передаётся одной JSON-строкой либо повторяющимися
+        полями, каждое из которых — JSON-значение элемента.
+        """
+        if not hasattr(self.initial_data, 'getlist'):
+            return self.initial_data.get(name)
+        values = self.initial_data.getlist(name)
+        try:
+            if len(values) == 1 and values[0].lstrip().startswith('['):
+                return json.loads(values[0])
+            return [json.loads(value) for value in values] or None
+        except ValueError:
+            raise serializers.ValidationError(
+                f'Некорректный JSON в поле {name}'
+            )
+
+    def get_amounts(self, ingredients):
+        if not isinstance(ingredients, list) or not ingredients:
+            raise serializers.ValidationError(
+                {'ingredients': 'Нужен хотя бы один ингредиент'}
             )
+        items = IngredientAmountSerializer(data=ingredients, many=True)
+        if not items.is_valid():
+            raise serializers.ValidationError({'ingredients': items.errors})
+        ids = [item['id'] for item in items.validated_data]
+        self.get_objects('ingredients', Ingredient, ids)
+        return {item['id']: item['amount'] for item in items.validated_data}
+
+    def validate(self, data):
+        """Теги и ингредиенты не объявлены полями, поэтому читаются из
+        исходных данных и проверяются здесь, до сохранения."""
+        tags = self.get_initial_list('tags')
+        ingredients = self.get_initial_list('ingredients')
+        if self.instance is None:
+            missing = {
+                name: 'Обязательное поле.'
+                for name, value in (('tags', tags),
+                                    ('ingredients', ingredients))
+                if value is None
+            }
+            if missing:
+                raise serializers.ValidationError(missing)
+        if tags is not None:
+            data['tags'] = list(self.get_objects('tags', Tag, tags).values())
+        if ingredients is not None:
+            data['amounts'] = self.get_amounts(ingredients)
+        return data
+
+    @transaction.atomic
+    def create(self, validated_data):
+        tags = validated_data.pop('tags')
+        amounts = validated_data.pop('amounts')
+        recipe = Recipe.objects.create(**validated_data)
+        recipe.tags.set(tags)
+        Amount.objects.bulk_create(
+            Amount(recipe=recipe, ingredient_id=ingredient_id, amount=amount)
+            for ingredient_id, amount in amounts.items()
+        )
+        schedule_image_processing(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
+        old_image = instance.image.name
         instance.image = validated_data.get('image', instance.image)
         instance.name = validated_data.get('name', instance.name)
         instance.text = validated_data.get('text', instance.text)
         instance.cooking_time = validated_data.get(
             'cooking_time', instance.cooking_time
         )
-        instance.tags.clear()
-        tags_data = self.initial_data.get('tags')
-        instance.tags.set(tags_data)
-        Amount.objects.filter(recipe=instance).all().delete()
-        ingredient_amount_data = self.initial_data.get('ingredients')
-        for ingredient_amount in ingredient_amount_data:
-            ingredient_id = ingredient_amount.get('id')
-            amount = ingredient_amount.get('amount')
-            Amount.objects.create(
-                recipe=instance,
-                ingredient_id=ingredient_id,
-                amount=amount
-            )
-        instance.save()
+        if 'tags' in validated_data:
+            instance.tags.set(validated_data['tags'])
+        if 'amounts' in validated_data:
+            self.update_amounts(instance, validated_data['amounts'])
+        instance.save(update_fields=('image', 'name', 'text', 'cooking_time'))
+        if instance.image.name != old_image:
+            schedule_image_processing(instance)
         return instance
 
+    @staticmethod
+    def update_amounts(instance, amounts):
+        """Удаляет, изменяет и создаёт только отличающиеся строки Amount."""
+        existing = {
+            amount.ingredient_id: amount
+            for amount in Amount.objects.select_for_update().filter(
+                recipe=instance
+            )
+        }
+        Amount.objects.filter(pk__in=[
+            amount.pk for ingredient_id, amount in existing.items()
+            if ingredient_id not in amounts
+        ]).delete()
+        changed = []
+        for ingredient_id, amount in existing.items():
+            if (ingredient_id in amounts
+                    and amount.amount != amounts[ingredient_id]):
+                amount.amount = amounts[ingredient_id]
+                changed.append(amount)
+        Amount.objects.bulk_update(changed, ['amount'])
+        Amount.objects.bulk_create(
+            Amount(recipe=instance, ingredient_id=ingredient_id, amount=amount)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        )
+
     def get_tags(self, obj):
         return TagSerializer(
             Tag.objects.filter(recipe=obj), many=True
@@ -139,7 +257,8 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 
     def get_ingredients(self, obj):
         return AmountSerializer(
-            Amount.objects.filter(recipe=obj), many=True
+            Amount.objects.filter(recipe=obj).select_related('ingredient'),
+            many=True
         ).data
 
 
@@ -232,13 +351,17 @@ class FollowSerializer(serializers.ModelSerializer):
                   'is_subscribed', 'recipes', 'recipes_count')
 
     def get_is_subscribed(self, obj):
-        return Follow.objects.filter(
-            user=obj.user, author=obj.author
-        ).exists()
+        return True
 
     def get_recipes(self, obj):
-        queryset = Recipe.objects.filter(author=obj.author)
+        recipes_limit = self.context.get('recipes_limit')
+        if hasattr(obj.author, 'limited_recipes'):
+            queryset = obj.author.limited_recipes
+        else:
+            queryset = Recipe.objects.filter(author=obj.author)
+            if recipes_limit is not None:
+                queryset = queryset[:recipes_limit]
         return FollowRecipeSerializer(queryset, many=True).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+        return obj.author.recipes_count
@@ -0,0 +1,77 @@
+import csv
+import json
+
+from django.db.models import Sum
+from rest_framework.negotiation import DefaultContentNegotiation
+
+from foodgram.models import Amount
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'txt': 'text/plain',
+    'json': 'application/json',
+}
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+class IgnoreFormatContentNegotiation(DefaultContentNegotiation):
+    """Параметр format выбирает формат файла, а не рендерер DRF."""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+def get_shopping_list(user):
+    """Суммы ингредиентов из списка покупок пользователя одним запросом."""
+    return Amount.objects.filter(
+        recipe__cart__user=user
+    ).values(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(
+        total=Sum('amount')
+    ).order_by('ingredient__name')
+
+
+def format_line(count, row):
+    return (
+        f'{count}. {row["ingredient__name"].capitalize()} '
+        f'({row["ingredient__measurement_unit"]}) - {row["total"]}\n'
+    )
+
+
+def render_csv(rows):
+    """Прежний формат файла: одна колонка с пронумерованными строками."""
+    writer = csv.writer(Echo(), lineterminator='\r')
+    for count, row in enumerate(rows, start=1):
+        yield writer.writerow([format_line(count, row)])
+
+
+def render_txt(rows):
+    for count, row in enumerate(rows, start=1):
+        yield format_line(count, row)
+
+
+def render_json(rows):
+    separator = ''
+    yield '['
+    for row in rows:
+        yield separator + json.dumps({
+            'name': row['ingredient__name'],
+            'measurement_unit': row['ingredient__measurement_unit'],
+            'amount': row['total'],
+        }, ensure_ascii=False)
+        separator = ', '
+    yield ']'
+
+
+RENDERERS = {
+    'csv': render_csv,
+    'txt': render_txt,
+    'json': render_json,
+}
@@ -0,0 +1,1423 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
+import tempfile
+import uuid
+from collections import OrderedDict
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api import urls as api_urls
+from api.concurrency import READ_ROUTES, with_concurrent_reads
+from api.ingredient_index import SEARCH_LIMIT, ingredient_index
+from api.renderers import FastJSONRenderer
+from api.profiling import (FILE_KINDS, profile_ids, profile_path,
+                           sign_header)
+from api.recipe_index import (IngredientRecipeIndex, query_missing_at_most,
+                              query_with_all, query_with_any)
+from api.serializers import RecipeCreateSerializer
+from foodgram.images import LEASE_TIMEOUT
+from foodgram.models import (Amount, Cart, Favorite, Follow, ImageJob,
+                             Ingredient, Recipe, ReferenceFile, Tag)
+from foodgram.search import create_search_index, update_search_index
+from foodgram.signals import change_counter
+from users import urls as users_urls
+from users.authentication import CACHE_KEY, check_shared_cache
+from users.models import User
+
+
+def clear_caches():
+    for backend in caches.all():
+        backend.clear()
+
+
+class RecipeFeedTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Без миграций таблицы FTS нет; обновления индекса после commit
+        # в TestCase не выполняются, поэтому он строится здесь.
+        create_search_index()
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='pass12345qq', first_name='Иван', last_name='Иванов'
+        )
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', color='#000000',
+                               slug=f'tag{number}')
+            for number in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(5)
+        ]
+        for number in range(12):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=10, image='recipes/test.jpg'
+            )
+            recipe.tags.set(cls.tags[:number % 2 + 1])
+            Amount.objects.bulk_create(
+                Amount(recipe=recipe, ingredient=ingredient, amount=number + 1)
+                for ingredient in cls.ingredients[:number % 5 + 1]
+            )
+        update_search_index()
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+
+    def authorized_client(self, user=None):
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user or self.author)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+
+class ResponseCacheTest(RecipeFeedTestCase):
+    def test_cached_response_content_type(self):
+        miss = self.client.get('/api/recipes/')
+        hit = self.client.get('/api/recipes/')
+        self.assertEqual(miss['X-Cache'], 'MISS')
+        self.assertEqual(hit['X-Cache'], 'HIT')
+        for response in (miss, hit):
+            self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(hit.json(), json.loads(miss.content))
+
+
+class RecipeListQueriesTest(RecipeFeedTestCase):
+    """Число запросов ленты не зависит от размера страницы."""
+
+    LIMITS = (2, 6)
+
+    def assert_list_queries(self, client, queries, cold=True):
+        for limit in self.LIMITS:
+            if cold:
+                clear_caches()
+            with self.subTest(limit=limit), self.assertNumQueries(queries):
+                response = client.get(f'/api/recipes/?limit={limit}')
+                results = json.loads(response.content)['results']
+                self.assertEqual(len(results), limit)
+
+    def test_anonymous(self):
+        # COUNT, страница с авторами, теги и ингредиенты фрагментов.
+        self.assert_list_queries(self.client, 4)
+
+    def test_authorized(self):
+        # Плюс токен и множества избранного, корзины и подписок.
+        self.assert_list_queries(self.authorized_client(), 6)
+
+    def test_cached_fragments(self):
+        # С готовыми фрагментами остаются COUNT и страница.
+        self.client.get('/api/recipes/?limit=12')
+        self.assert_list_queries(self.client, 2, cold=False)
+
+
+class TokenAuthenticationTest(RecipeFeedTestCase):
+    """Выход, смена пароля и блокировка сбрасывают кэш токена."""
+
+    def setUp(self):
+        super().setUp()
+        self.token, _ = Token.objects.get_or_create(user=self.author)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        self.assertIsNotNone(self.cached())
+
+    def cached(self):
+        return cache.get(CACHE_KEY.format(self.token.key))
+
+    def test_logout(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(self.cached())
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_password_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/set_password/', {
+                'current_password': 'pass12345qq',
+                'new_password': 'new-pass12345qq',
+            })
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(self.cached())
+        response = self.client.get('/api/users/me/')
+        self.assertTrue(
+            response.wsgi_request.user.check_password('new-pass12345qq')
+        )
+
+    def test_deactivation(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.is_active = False
+            self.author.save()
+        self.assertIsNone(self.cached())
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    @override_settings(AUTH_TOKEN_CACHE_TIMEOUT=0)
+    def test_cache_disabled(self):
+        cache.clear()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        self.assertIsNone(self.cached())
+
+    def test_deploy_check(self):
+        messages = check_shared_cache(None)
+        self.assertEqual([message.id for message in messages], ['users.W001'])
+        with override_settings(AUTH_TOKEN_CACHE_TIMEOUT=0):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class ResponseCacheInvalidationTest(RecipeFeedTestCase):
+    """Правка рецепта сбрасывает страницы с фильтрами."""
+
+    def get_ids(self, url, cache_status):
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], cache_status)
+        return {recipe['id'] for recipe in json.loads(response.content)[
+            'results'
+        ]}
+
+    def test_recipe_gains_tag(self):
+        url = f'/api/recipes/?tags={self.tags[1].slug}&limit=20'
+        recipe = Recipe.objects.exclude(tags=self.tags[1]).first()
+        self.assertNotIn(recipe.pk, self.get_ids(url, 'MISS'))
+        self.assertNotIn(recipe.pk, self.get_ids(url, 'HIT'))
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.tags.add(self.tags[1])
+        self.assertIn(recipe.pk, self.get_ids(url, 'MISS'))
+
+    def test_recipe_matches_search(self):
+        url = '/api/recipes/?search=шарлотка'
+        recipe = Recipe.objects.first()
+        self.assertEqual(self.get_ids(url, 'MISS'), set())
+        self.assertEqual(self.get_ids(url, 'HIT'), set())
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.name = 'Шарлотка'
+            recipe.save()
+        self.assertEqual(self.get_ids(url, 'MISS'), {recipe.pk})
+
+    def test_unfiltered_page_survives_edit(self):
+        url = '/api/recipes/?limit=2'
+        recipe = Recipe.objects.order_by('pub_date', 'id').first()
+        self.assertNotIn(recipe.pk, self.get_ids(url, 'MISS'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Amount.objects.create(
+                recipe=recipe, ingredient=self.ingredients[-1], amount=1
+            )
+        self.get_ids(url, 'HIT')
+
+    def test_ordering_not_cached(self):
+        url = '/api/recipes/?ordering=-favorites_count'
+        for _ in range(2):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('X-Cache', response)
+
+    def test_scheme_in_key(self):
+        self.assertEqual(self.client.get('/api/recipes/')['X-Cache'], 'MISS')
+        response = self.client.get('/api/recipes/', secure=True)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertTrue(response.json()['results'])
+
+
+class IngredientFilterTest(RecipeFeedTestCase):
+    """Фильтры по ингредиентам и журнал изменений индекса."""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch(
+            'api.filters.ingredient_recipe_index', IngredientRecipeIndex()
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_ids(self, query):
+        response = self.client.get(f'/api/recipes/?{query}&limit=100')
+        self.assertEqual(response.status_code, 200)
+        return {recipe['id'] for recipe in response.json()['results']}
+
+    def test_filters_match_queries(self):
+        first, second = self.ingredients[1].pk, self.ingredients[3].pk
+        cases = (
+            (f'ingredients={first},{second}', query_with_all([first, second])),
+            (f'ingredients_any={second}', query_with_any([second])),
+            (f'ingredients_any={first},{second}&max_missing=1',
+             query_missing_at_most([first, second], 1)),
+        )
+        for query, expected in cases:
+            with self.subTest(query=query):
+                self.assertEqual(self.get_ids(query), set(expected))
+                with mock.patch('api.recipe_index.MAX_INLINE_IDS', 0):
+                    self.assertEqual(self.get_ids(query), set(expected))
+
+    def test_changes_reach_other_processes(self):
+        other = IngredientRecipeIndex()
+        ingredient = self.ingredients[-1]
+        recipe = Recipe.objects.exclude(
+            ingredient_amount__ingredient=ingredient
+        )[0]
+        deleted = Recipe.objects.filter(
+            ingredient_amount__ingredient=ingredient
+        )[0]
+        self.assertNotIn(recipe.pk, other.with_any([ingredient.pk]))
+        with self.captureOnCommitCallbacks(execute=True):
+            Amount.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=1
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            deleted.delete()
+        # Изменения применяются из журнала, без прохода по Amount.
+        with self.assertNumQueries(0):
+            found = other.with_all([ingredient.pk])
+        self.assertIn(recipe.pk, found)
+        self.assertNotIn(deleted.pk, found)
+        self.assertIn(recipe.pk, self.get_ids(f'ingredients={ingredient.pk}'))
+
+    def test_invalid_values(self):
+        for query in ('ingredients=1.5', 'ingredients_any=a',
+                      'max_missing=1', 'ingredients_any=1&max_missing=-1'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/recipes/?{query}')
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(SERVER_TIMING=True)
+class RequestTimingTest(RecipeFeedTestCase):
+    """SQL параллельных ASGI-запросов считается каждому запросу отдельно."""
+
+    URLS = ('/api/recipes/?limit=2', '/api/users/')
+
+    def sql_count(self, response):
+        db = response['Server-Timing'].split(',')[0]
+        return int(re.search(r'desc="(\d+) queries"', db).group(1))
+
+    async def test_concurrent_requests(self):
+        client = AsyncClient()
+        expected = []
+        for url in self.URLS:
+            await sync_to_async(clear_caches)()
+            expected.append(self.sql_count(await client.get(url)))
+        await sync_to_async(clear_caches)()
+        responses = await asyncio.gather(
+            *(client.get(url) for url in self.URLS)
+        )
+        self.assertEqual(
+            [self.sql_count(response) for response in responses], expected
+        )
+        self.assertTrue(all(expected))
+
+
+class MembershipTest(RecipeFeedTestCase):
+    """Флаги избранного и корзины видны в следующем же запросе."""
+
+    def test_flags_follow_changes(self):
+        client = self.authorized_client()
+        recipe = Recipe.objects.first()
+        url = f'/api/recipes/{recipe.pk}/'
+        for action, field in (('favorite', 'is_favorited'),
+                              ('shopping_cart', 'is_in_shopping_cart')):
+            with self.subTest(action=action):
+                self.assertFalse(client.get(url).json()[field])
+                response = client.post(f'{url}{action}/')
+                self.assertEqual(response.status_code, 201)
+                self.assertTrue(client.get(url).json()[field])
+                feed = client.get('/api/recipes/?limit=20').json()
+                self.assertTrue(next(
+                    item[field] for item in feed['results']
+                    if item['id'] == recipe.pk
+                ))
+                response = client.delete(f'{url}{action}/')
+                self.assertEqual(response.status_code, 204)
+                self.assertFalse(client.get(url).json()[field])
+
+
+class CatalogueTest(RecipeFeedTestCase):
+    """Справочники: ETag, 304 и сброс после изменения."""
+
+    url = '/api/tags/'
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        matching = (etag, f'W/{etag}', f'"other", {etag}', '*')
+        for header in matching:
+            with self.subTest(header=header), self.assertNumQueries(0):
+                response = self.client.get(
+                    self.url, HTTP_IF_NONE_MATCH=header
+                )
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+        for header in ('"other"', etag[:-2] + '"', f'"x{etag[1:]}'):
+            with self.subTest(header=header):
+                response = self.client.get(
+                    self.url, HTTP_IF_NONE_MATCH=header
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_invalidation(self):
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.json()), len(self.tags))
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Новый', color='#FFFFFF', slug='new')
+        updated = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(updated.status_code, 200)
+        self.assertNotEqual(updated['ETag'], response['ETag'])
+        self.assertIn('new', [tag['slug'] for tag in updated.json()])
+
+
+class ConcurrentReadsTest(TestCase):
+    """Под ASYNC_READS маршруты READ_ROUTES обслуживает async-обёртка."""
+
+    @override_settings(ASYNC_READS=True)
+    def test_read_routes_wrapped(self):
+        patterns = [
+            *with_concurrent_reads(api_urls.router.get_urls()),
+            *with_concurrent_reads(users_urls.router.get_urls()),
+        ]
+        wrapped = {
+            pattern.name for pattern in patterns
+            if asyncio.iscoroutinefunction(pattern.callback)
+        }
+        self.assertEqual(wrapped, READ_ROUTES)
+
+    def test_disabled(self):
+        patterns = with_concurrent_reads(api_urls.router.get_urls())
+        self.assertFalse(any(
+            asyncio.iscoroutinefunction(pattern.callback)
+            for pattern in patterns
+        ))
+
+
+class MetricsViewTest(TestCase):
+    url = '/api/metrics'
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_closed_without_token(self):
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        for header, status in (('', 403), ('Bearer wrong', 403),
+                               ('Token secret', 403), ('Bearer secret', 200)):
+            with self.subTest(header=header):
+                response = self.client.get(
+                    self.url, HTTP_AUTHORIZATION=header
+                )
+                self.assertEqual(response.status_code, status)
+
+
+@skipUnless(connection.vendor in ('postgresql', 'sqlite'),
+            'Полнотекстовый поиск есть только в PostgreSQL и SQLite')
+class SearchTest(RecipeFeedTestCase):
+    """Поиск по названию, описанию и ингредиентам с ранжированием."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        recipes = Recipe.objects.order_by('id')
+        cls.by_name, cls.by_text, cls.by_ingredient = recipes[:3]
+        Recipe.objects.filter(pk=cls.by_name.pk).update(name='Шарлотка')
+        Recipe.objects.filter(pk=cls.by_text.pk).update(
+            text='Почти как шарлотка'
+        )
+        ingredient = Ingredient.objects.create(
+            name='шарлотка замороженная', measurement_unit='г'
+        )
+        Amount.objects.create(
+            recipe=cls.by_ingredient, ingredient=ingredient, amount=1
+        )
+        update_search_index()
+
+    def search(self, value):
+        response = self.client.get('/api/recipes/', {'search': value})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_ranking(self):
+        self.assertEqual(self.search('шарлотка'), [
+            self.by_name.pk, self.by_text.pk, self.by_ingredient.pk
+        ])
+
+    def test_no_match(self):
+        self.assertEqual(self.search('борщ'), [])
+
+    def test_index_follows_edits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.by_name.name = 'Борщ'
+            self.by_name.save()
+        self.assertEqual(self.search('борщ'), [self.by_name.pk])
+        self.assertNotIn(self.by_name.pk, self.search('шарлотка'))
+
+    @skipUnless(connection.vendor == 'sqlite', 'Префиксы ищет FTS5')
+    def test_prefix(self):
+        self.assertEqual(self.search('шарл')[0], self.by_name.pk)
+
+
+class ProcessImagesTest(RecipeFeedTestCase):
+    """process_images забирает только задачи с истёкшей арендой."""
+
+    def test_reclaims_only_stale_jobs(self):
+        recipe = Recipe.objects.first()
+        stale, fresh = (
+            ImageJob.objects.create(
+                recipe=recipe, image=recipe.image.name,
+                status=ImageJob.PROCESSING, attempts=1
+            )
+            for _ in range(2)
+        )
+        ImageJob.objects.filter(pk=stale.pk).update(
+            updated=timezone.now() - timedelta(seconds=LEASE_TIMEOUT + 1)
+        )
+        with mock.patch(
+            'foodgram.management.commands.process_images.process_job'
+        ) as process_job:
+            call_command('process_images', stdout=StringIO())
+        self.assertEqual(
+            [call[0][0] for call in process_job.call_args_list],
+            [stale.pk]
+        )
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(stale.status, ImageJob.FAILED)
+        self.assertEqual(fresh.status, ImageJob.PROCESSING)
+
+
+class RecipeTransferTest(RecipeFeedTestCase):
+    """export_recipes и import_recipes: перенос без потерь и ошибки строк.
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def export(self, name):
+        path = os.path.join(self.directory, name)
+        call_command('export_recipes', path, stderr=StringIO())
+        with open(path, encoding='utf-8') as file:
+            return path, [json.loads(line) for line in file]
+
+    def import_file(self, path):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_recipes', path, stdout=stdout, stderr=stderr)
+        return stderr.getvalue()
+
+    def test_round_trip(self):
+        path, exported = self.export('first.jsonl')
+        Recipe.objects.all().delete()
+        self.assertEqual(self.import_file(path), '')
+        self.assertEqual(self.export('second.jsonl')[1], exported)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, len(exported))
+
+    def test_bad_rows(self):
+        _, exported = self.export('first.jsonl')
+        good = exported[0]
+        rows = [
+            good,
+            dict(good, pub_date='2022-13-45T00:00:00'),
+            dict(good, pub_date='вчера'),
+            dict(good, author='nobody@example.com'),
+        ]
+        path = os.path.join(self.directory, 'bad.jsonl')
+        with open(path, 'w', encoding='utf-8') as file:
+            for row in rows:
+                file.write(json.dumps(row, ensure_ascii=False) + '\n')
+            file.write('{не json\n')
+        before = Recipe.objects.count()
+        errors = self.import_file(path)
+        self.assertEqual(Recipe.objects.count(), before + 1)
+        for number in range(2, 6):
+            self.assertIn(f'Строка {number}:', errors)
+        self.assertIn('неверная дата', errors)
+
+
+class CountersTest(RecipeFeedTestCase):
+    """Денормализованные счётчики избранного, корзины и рецептов."""
+
+    def setUp(self):
+        super().setUp()
+        self.reader = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='pass12345qq'
+        )
+        self.recipe = Recipe.objects.first()
+
+    def counters(self):
+        self.recipe.refresh_from_db()
+        return self.recipe.favorites_count, self.recipe.cart_count
+
+    def test_favorite_and_cart(self):
+        client = self.authorized_client(self.reader)
+        url = f'/api/recipes/{self.recipe.pk}/'
+        client.post(f'{url}favorite/')
+        client.post(f'{url}shopping_cart/')
+        self.assertEqual(self.counters(), (1, 1))
+        client.delete(f'{url}favorite/')
+        self.assertEqual(self.counters(), (0, 1))
+        client.delete(f'{url}shopping_cart/')
+        self.assertEqual(self.counters(), (0, 0))
+
+    def test_cascade_deletes(self):
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        Cart.objects.create(user=self.reader, recipe=self.recipe)
+        self.assertEqual(self.counters(), (1, 1))
+        count = self.author.recipes.count()
+        with mock.patch('foodgram.signals.logger') as logger:
+            self.reader.delete()
+            self.assertEqual(self.counters(), (0, 0))
+            self.recipe.delete()
+        logger.warning.assert_not_called()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, count - 1)
+
+    def test_decrement_below_zero_warns(self):
+        with self.assertLogs('foodgram.signals', 'WARNING'):
+            change_counter(Recipe, self.recipe.pk, 'favorites_count', -1)
+        self.assertEqual(self.counters(), (0, 0))
+
+
+class ShoppingListTest(RecipeFeedTestCase):
+    URL = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.authorized_client()
+        self.recipes = list(Recipe.objects.order_by('id'))
+
+    def fill_cart(self, count):
+        for recipe in self.recipes[:count]:
+            Cart.objects.create(user=self.author, recipe=recipe)
+
+    def download(self, **params):
+        response = self.client.get(self.URL, params)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_default_csv_layout(self):
+        self.fill_cart(2)
+        response, content = self.download()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(
+            response['Content-Disposition'],
+            'attachment; filename="shopping_list.csv"'
+        )
+        self.assertEqual(
+            content,
+            '1. Ингредиент 0 (г) - 3\n\r2. Ингредиент 1 (г) - 2\n\r'
+        )
+        self.assertEqual(self.download(format='csv')[1], content)
+
+    def test_txt(self):
+        self.fill_cart(2)
+        response, content = self.download(format='txt')
+        self.assertEqual(
+            response['Content-Type'], 'text/plain; charset=utf-8'
+        )
+        self.assertEqual(
+            content, '1. Ингредиент 0 (г) - 3\n2. Ингредиент 1 (г) - 2\n'
+        )
+
+    def test_json(self):
+        self.fill_cart(2)
+        response, content = self.download(format='json')
+        self.assertEqual(
+            response['Content-Type'], 'application/json; charset=utf-8'
+        )
+        self.assertEqual(json.loads(content), [
+            {'name': 'ингредиент 0', 'measurement_unit': 'г', 'amount': 3},
+            {'name': 'ингредиент 1', 'measurement_unit': 'г', 'amount': 2},
+        ])
+
+    def test_empty_cart(self):
+        self.assertEqual(self.download()[1], '')
+        self.assertEqual(json.loads(self.download(format='json')[1]), [])
+
+    def test_unsupported_format(self):
+        response = self.client.get(self.URL, {'format': 'pdf'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('pdf', response.json()['error'])
+
+    def test_anonymous(self):
+        self.assertEqual(APIClient().get(self.URL).status_code, 401)
+
+    def test_queries_do_not_grow_with_cart(self):
+        # Первый запрос кэширует токен.
+        self.download()
+        counts = []
+        for size in (1, len(self.recipes)):
+            Cart.objects.all().delete()
+            self.fill_cart(size)
+            with CaptureQueriesContext(connection) as queries:
+                self.download()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class SubscriptionsTest(RecipeFeedTestCase):
+    URL = '/api/users/subscriptions/'
+
+    def setUp(self):
+        super().setUp()
+        self.reader = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='pass12345qq'
+        )
+        self.client = self.authorized_client(self.reader)
+        self.client.get(self.URL)
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def add_author(self, number, recipes):
+        author = User.objects.create_user(
+            username=f'author{number}', email=f'author{number}@example.com',
+            password='pass12345qq'
+        )
+        for recipe_number in range(recipes):
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}.{recipe_number}',
+                text='Текст', cooking_time=10, image='recipes/test.jpg'
+            )
+        Follow.objects.create(user=self.reader, author=author)
+        return author
+
+    def subscriptions(self, **params):
+        response = self.client.get(self.URL, params)
+        self.assertEqual(response.status_code, 200)
+        return {row['id']: row for row in response.json()['results']}
+
+    def test_recipes_limit(self):
+        latest = list(
+            self.author.recipes.order_by('-pub_date').values_list(
+                'id', flat=True
+            )
+        )
+        for limit, expected in ((None, 12), (3, 3), (0, 0), (20, 12)):
+            params = {} if limit is None else {'recipes_limit': limit}
+            row = self.subscriptions(**params)[self.author.id]
+            self.assertEqual(
+                [recipe['id'] for recipe in row['recipes']],
+                latest[:expected]
+            )
+            self.assertEqual(row['recipes_count'], 12)
+
+    def test_limit_per_author(self):
+        other = self.add_author(1, 1)
+        rows = self.subscriptions(recipes_limit=2)
+        self.assertEqual(len(rows[self.author.id]['recipes']), 2)
+        self.assertEqual(len(rows[other.id]['recipes']), 1)
+
+    def test_invalid_limit_ignored(self):
+        for value in ('abc', '-1'):
+            row = self.subscriptions(recipes_limit=value)[self.author.id]
+            self.assertEqual(len(row['recipes']), 12)
+
+    def test_queries_do_not_grow_with_authors(self):
+        for limit in (0, 2):
+            with CaptureQueriesContext(connection) as few:
+                self.subscriptions(recipes_limit=limit)
+            for number in range(3):
+                self.add_author(number + limit * 10, 4)
+            with CaptureQueriesContext(connection) as many:
+                self.subscriptions(recipes_limit=limit)
+            self.assertEqual(len(few), len(many))
+
+
+def png_bytes(color='red'):
+    buffer = BytesIO()
+    Image.new('RGB', (4, 4), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def png_base64(color='red'):
+    encoded = base64.b64encode(png_bytes(color)).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+def use_temp_media(test):
+    """Переключает MEDIA_ROOT на временный каталог до конца теста."""
+    media = tempfile.TemporaryDirectory()
+    test.addCleanup(media.cleanup)
+    media_root = override_settings(MEDIA_ROOT=media.name)
+    media_root.enable()
+    test.addCleanup(media_root.disable)
+    return media.name
+
+
+class RecipeWriteTest(RecipeFeedTestCase):
+    """Создание и изменение рецепта: ошибки, запросы, строки Amount."""
+
+    URL = '/api/recipes/'
+
+    def setUp(self):
+        super().setUp()
+        use_temp_media(self)
+        self.client = self.authorized_client()
+        # Токен кэшируется первым запросом и не попадает в подсчёты.
+        self.client.get('/api/users/me/')
+        self.recipe = Recipe.objects.get(name='Рецепт 4')
+
+    def payload(self, count=2, **fields):
+        data = {
+            'name': 'Новый рецепт', 'text': 'Текст', 'cooking_time': 5,
+            'image': png_base64(), 'tags': [self.tags[0].pk],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': number + 1}
+                for number, ingredient in enumerate(self.ingredients[:count])
+            ],
+        }
+        data.update(fields)
+        return data
+
+    def amounts(self, recipe):
+        return dict(
+            Amount.objects.filter(recipe=recipe).values_list(
+                'ingredient_id', 'amount'
+            )
+        )
+
+    def test_create(self):
+        response = self.client.post(self.URL, self.payload(), format='json')
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get(pk=response.json()['id'])
+        self.assertEqual(recipe.author, self.author)
+        self.assertEqual(list(recipe.tags.all()), [self.tags[0]])
+        self.assertEqual(self.amounts(recipe), {
+            self.ingredients[0].pk: 1, self.ingredients[1].pk: 2
+        })
+
+    def test_create_queries_do_not_grow_with_ingredients(self):
+        counts = []
+        for count in (1, 5):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    self.URL, self.payload(count), format='json'
+                )
+            self.assertEqual(response.status_code, 201)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_invalid_ids(self):
+        ingredient = self.ingredients[0].pk
+        cases = {
+            'tags': [[999], [self.tags[0].pk, self.tags[0].pk], ['x']],
+            'ingredients': [
+                [{'id': 999, 'amount': 1}],
+                [{'id': ingredient, 'amount': 1}] * 2,
+                [],
+            ],
+        }
+        for name, values in cases.items():
+            for value in values:
+                with self.subTest(name=name, value=value):
+                    response = self.client.post(
+                        self.URL, self.payload(**{name: value}),
+                        format='json'
+                    )
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn(name, response.json())
+        self.assertFalse(Recipe.objects.filter(name='Новый рецепт').exists())
+
+    def test_update_keeps_unchanged_rows(self):
+        before = {
+            amount.ingredient_id: amount
+            for amount in Amount.objects.filter(recipe=self.recipe)
+        }
+        first, second, third = self.ingredients[:3]
+        response = self.client.patch(
+            f'{self.URL}{self.recipe.pk}/', {'ingredients': [
+                {'id': first.pk, 'amount': before[first.pk].amount},
+                {'id': second.pk, 'amount': 100},
+            ]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        after = {
+            amount.ingredient_id: amount
+            for amount in Amount.objects.filter(recipe=self.recipe)
+        }
+        self.assertEqual(set(after), {first.pk, second.pk})
+        self.assertEqual(after[first.pk].pk, before[first.pk].pk)
+        self.assertEqual(after[second.pk].pk, before[second.pk].pk)
+        self.assertEqual(after[second.pk].amount, 100)
+        self.assertIn(third.pk, before)
+
+    def test_update_queries_do_not_grow_with_ingredients(self):
+        counts = []
+        for ingredients in (self.ingredients[:1], self.ingredients):
+            Amount.objects.filter(recipe=self.recipe).delete()
+            Amount.objects.bulk_create(
+                Amount(recipe=self.recipe, ingredient=ingredient, amount=1)
+                for ingredient in ingredients
+            )
+            data = {'ingredients': [
+                {'id': ingredient.pk, 'amount': 2}
+                for ingredient in ingredients
+            ]}
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.patch(
+                    f'{self.URL}{self.recipe.pk}/', data, format='json'
+                )
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_update_without_ingredients_keeps_amounts(self):
+        before = self.amounts(self.recipe)
+        response = self.client.patch(
+            f'{self.URL}{self.recipe.pk}/', {'name': 'Другое'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.amounts(self.recipe), before)
+
+
+class IngredientSearchTest(TestCase):
+    """Автодополнение ингредиентов по параметру name."""
+
+    URL = '/api/ingredients/'
+
+    @classmethod
+    def setUpTestData(cls):
+        names = [
+            'сахар', 'Сахарная пудра', 'тростниковый сахар', 'соль', 'Мёд',
+        ] + [f'перец {number:02}' for number in range(30)]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г') for name in names
+        )
+
+    def setUp(self):
+        clear_caches()
+        ingredient_index.invalidate()
+
+    def names(self, query):
+        response = self.client.get(self.URL, {'name': query})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.json()]
+
+    def test_prefix_before_substring(self):
+        expected = ['сахар', 'Сахарная пудра', 'тростниковый сахар']
+        self.assertEqual(self.names('сах'), expected)
+        self.assertEqual(self.names('САХ'), expected)
+
+    def test_trigram_similarity(self):
+        self.assertEqual(self.names('сохар')[0], 'сахар')
+        self.assertEqual(self.names('ксилит'), [])
+
+    def test_yo_normalized(self):
+        self.assertEqual(self.names('мед'), ['Мёд'])
+        self.assertEqual(self.names('мёд'), ['Мёд'])
+
+    def test_limit(self):
+        names = self.names('перец')
+        self.assertEqual(len(names), SEARCH_LIMIT)
+        self.assertEqual(names, sorted(names))
+
+    def test_item_fields(self):
+        response = self.client.get(self.URL, {'name': 'соль'})
+        ingredient = Ingredient.objects.get(name='соль')
+        self.assertEqual(response.json(), [{
+            'id': ingredient.pk, 'name': 'соль', 'measurement_unit': 'г'
+        }])
+
+    def test_new_ingredient_found(self):
+        self.assertEqual(self.names('ваниль'), [])
+        Ingredient.objects.create(name='ванильный сахар', measurement_unit='г')
+        self.assertEqual(self.names('ваниль'), ['ванильный сахар'])
+
+
+class CursorPaginationTest(RecipeFeedTestCase):
+    """Режим cursor ленты: обход, возврат назад и ошибки."""
+
+    URL = '/api/recipes/'
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def ids(self, page):
+        return [recipe['id'] for recipe in page['results']]
+
+    def walk(self, limit):
+        pages = [self.get(self.URL, cursor='', limit=limit)]
+        while pages[-1]['next']:
+            pages.append(self.get(pages[-1]['next']))
+        return pages
+
+    def expected(self):
+        return list(
+            Recipe.objects.order_by('-pub_date', '-id').values_list(
+                'id', flat=True
+            )
+        )
+
+    def test_walk_forward_and_back(self):
+        pages = self.walk(5)
+        self.assertEqual(
+            [len(self.ids(page)) for page in pages], [5, 5, 2]
+        )
+        self.assertEqual(sum(map(self.ids, pages), []), self.expected())
+        self.assertIsNone(pages[0]['previous'])
+        self.assertNotIn('count', pages[0])
+        for number in (1, 2):
+            previous = self.get(pages[number]['previous'])
+            self.assertEqual(self.ids(previous), self.ids(pages[number - 1]))
+        self.assertIsNone(self.get(pages[1]['previous'])['previous'])
+
+    def test_equal_pub_dates(self):
+        Recipe.objects.update(pub_date=timezone.now())
+        pages = self.walk(5)
+        self.assertEqual(sum(map(self.ids, pages), []), self.expected())
+
+    def test_no_count_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.get(self.URL, cursor='', limit=5)
+        self.assertFalse(any(
+            'COUNT(' in query['sql'].upper() for query in queries
+        ))
+
+    def test_invalid_cursor(self):
+        for cursor in ('garbage', 'bm90IGpzb24=', 'e30='):
+            response = self.client.get(self.URL, {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+
+    def test_conflicting_ordering(self):
+        for params in ({'ordering': 'favorites_count'},
+                       {'search': 'рецепт'}):
+            response = self.client.get(self.URL, {'cursor': '', **params})
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('cursor', response.json())
+
+
+class MultipartUploadTest(RecipeFeedTestCase):
+    """Создание рецепта из multipart/form-data с файлом изображения."""
+
+    URL = '/api/recipes/'
+
+    def setUp(self):
+        super().setUp()
+        use_temp_media(self)
+        self.client = self.authorized_client()
+
+    def post(self, image=None, **fields):
+        image = image or SimpleUploadedFile(
+            'photo.png', png_bytes(), content_type='image/png'
+        )
+        first, second = self.ingredients[:2]
+        data = {
+            'name': 'Рецепт из формы', 'text': 'Текст', 'cooking_time': 5,
+            'image': image,
+            'tags': [str(tag.pk) for tag in self.tags],
+            'ingredients': json.dumps([
+                {'id': first.pk, 'amount': 3},
+                {'id': second.pk, 'amount': 4},
+            ]),
+        }
+        data.update(fields)
+        return self.client.post(self.URL, data, format='multipart')
+
+    def assert_created(self, response):
+        self.assertEqual(response.status_code, 201, response.content)
+        recipe = Recipe.objects.get(pk=response.json()['id'])
+        self.assertEqual(
+            dict(recipe.ingredient_amount.values_list(
+                'ingredient_id', 'amount'
+            )),
+            {self.ingredients[0].pk: 3, self.ingredients[1].pk: 4}
+        )
+        self.assertEqual(set(recipe.tags.all()), set(self.tags))
+        with recipe.image.open() as image:
+            self.assertEqual(image.read(), png_bytes())
+
+    def test_file_upload(self):
+        self.assert_created(self.post())
+
+    def test_repeated_ingredient_fields(self):
+        first, second = self.ingredients[:2]
+        self.assert_created(self.post(ingredients=[
+            json.dumps({'id': first.pk, 'amount': 3}),
+            json.dumps({'id': second.pk, 'amount': 4}),
+        ]))
+
+    def test_tags_as_json_array(self):
+        tags = json.dumps([tag.pk for tag in self.tags])
+        self.assert_created(self.post(tags=tags))
+
+    def test_invalid_json(self):
+        response = self.post(ingredients='[{"id": ')
+        self.assertEqual(response.status_code, 400)
+
+    def test_not_an_image(self):
+        response = self.post(SimpleUploadedFile(
+            'photo.png', b'<html></html>', content_type='image/png'
+        ))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('изображением', response.json()['detail'])
+        self.assertFalse(
+            Recipe.objects.filter(name='Рецепт из формы').exists()
+        )
+
+    def test_too_large(self):
+        with mock.patch('api.uploads.MAX_IMAGE_SIZE', 64):
+            response = self.post()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('64', response.json()['detail'])
+
+
+class MediaStorageTest(RecipeFeedTestCase):
+    """Хранилище по хэшу содержимого и очистка gc_media."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = use_temp_media(self)
+
+    def save(self, content):
+        return default_storage.save('recipes/photo.PNG', ContentFile(content))
+
+    def age(self, name, hours):
+        moment = (timezone.now() - timedelta(hours=hours)).timestamp()
+        os.utime(default_storage.path(name), (moment, moment))
+
+    def test_same_content_stored_once(self):
+        first = self.save(png_bytes())
+        self.assertEqual(self.save(png_bytes()), first)
+        other = self.save(png_bytes('blue'))
+        self.assertNotEqual(other, first)
+        digest = hashlib.sha256(png_bytes()).hexdigest()
+        self.assertEqual(first, f'recipes/{digest[:2]}/{digest}.png')
+        self.assertEqual(
+            default_storage.listdir(f'recipes/{digest[:2]}')[1],
+            [f'{digest}.png']
+        )
+
+    def test_reupload_refreshes_mtime(self):
+        name = self.save(png_bytes())
+        self.age(name, 48)
+        self.save(png_bytes())
+        self.assertGreater(
+            default_storage.get_modified_time(name),
+            timezone.now() - timedelta(hours=1)
+        )
+
+    def gc_media(self, *args):
+        call_command('gc_media', *args, stdout=StringIO())
+
+    def test_gc_media(self):
+        referenced = self.save(png_bytes('green'))
+        Recipe.objects.filter(pk=Recipe.objects.first().pk).update(
+            image=referenced
+        )
+        old = self.save(png_bytes('blue'))
+        young = self.save(png_bytes('white'))
+        for name in (referenced, old):
+            self.age(name, 48)
+        self.age(young, 2)
+        self.gc_media('--dry-run')
+        self.assertTrue(default_storage.exists(old))
+        self.gc_media()
+        self.assertTrue(default_storage.exists(referenced))
+        self.assertFalse(default_storage.exists(old))
+        self.assertTrue(default_storage.exists(young))
+        self.gc_media('--min-age', '1')
+        self.assertFalse(default_storage.exists(young))
+        self.assertTrue(default_storage.exists(referenced))
+
+
+class RecipeFragmentTest(RecipeFeedTestCase):
+    """Фрагменты рецептов совпадают с выводом сериализатора DRF."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = Recipe.objects.get(name='Рецепт 3')
+        self.reader = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='pass12345qq'
+        )
+
+    def serialized(self, user=None):
+        request = Request(APIRequestFactory().get('/'))
+        request.user = user or AnonymousUser()
+        data = RecipeCreateSerializer(
+            self.recipe, context={'request': request}
+        ).data
+        return dict(data, is_favorited=False, is_in_shopping_cart=False)
+
+    def test_matches_field_serializer(self):
+        response = self.client.get(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(json.loads(response.content), self.serialized())
+        listed = json.loads(
+            self.client.get('/api/recipes/', {'limit': 12}).content
+        )
+        self.assertIn(self.serialized(), listed['results'])
+
+    def test_user_flags_not_cached(self):
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        Follow.objects.create(user=self.reader, author=self.author)
+        url = f'/api/recipes/{self.recipe.pk}/'
+        reader = self.authorized_client(self.reader).get(url).json()
+        self.assertTrue(reader['is_favorited'])
+        self.assertFalse(reader['is_in_shopping_cart'])
+        self.assertTrue(reader['author']['is_subscribed'])
+        with CaptureQueriesContext(connection) as queries:
+            author = self.authorized_client().get(url).json()
+        self.assertFalse(author['is_favorited'])
+        self.assertFalse(author['author']['is_subscribed'])
+        self.assertFalse(any(
+            'foodgram_amount' in query['sql'] for query in queries
+        ))
+        self.assertEqual(self.client.get(url).json(), self.serialized())
+
+    def test_fragment_refreshed_after_change(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        client = self.authorized_client(self.reader)
+        client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = 'Переименован'
+            self.recipe.save()
+            Amount.objects.filter(recipe=self.recipe).delete()
+        data = client.get(url).json()
+        self.assertEqual(data['name'], 'Переименован')
+        self.assertEqual(data['ingredients'], [])
+
+
+class FastJSONRendererTest(RecipeFeedTestCase):
+    """FastJSONRenderer отдаёт те же байты, что и JSONRenderer."""
+
+    def assert_same(self, data, media_type='application/json'):
+        self.assertEqual(
+            FastJSONRenderer().render(data, media_type),
+            JSONRenderer().render(data, media_type)
+        )
+
+    def test_types(self):
+        moment = timezone.now()
+        self.assert_same({
+            'text': 'Ёжик «в тумане»    "\\ \n',
+            'numbers': [0, -1, 2 ** 53, 1.5, 0.001, 3.0],
+            'flags': [True, False, None],
+            'datetime': moment,
+            'date': moment.date(),
+            'time': moment.time(),
+            'duration': timedelta(minutes=90),
+            'decimal': Decimal('1.50'),
+            'uuid': uuid.UUID(int=1),
+            'lazy': gettext_lazy('Рецепт'),
+            'keys': {1: 'one', 'two': 2},
+            'ordered': OrderedDict([('b', 1), ('a', 2)]),
+            'nested': [{'tuple': (1, 'a'), 'set': []}],
+        })
+
+    def test_fallbacks(self):
+        self.assert_same({'big': 2 ** 70})
+        self.assert_same({'a': [1, 2]}, 'application/json; indent=4')
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_float_exponent_notation(self):
+        # orjson пишет 1e-7, json — 1e-07: значение то же, запись другая.
+        data = {'small': 1e-7, 'large': 1e16}
+        self.assertEqual(
+            json.loads(FastJSONRenderer().render(data)),
+            json.loads(JSONRenderer().render(data))
+        )
+
+    def test_api_responses(self):
+        client = self.authorized_client()
+        for url in ('/api/recipes/?limit=12', '/api/tags/',
+                    '/api/users/', '/api/users/me/',
+                    '/api/users/subscriptions/'):
+            clear_caches()
+            fast = client.get(url).content
+            clear_caches()
+            with mock.patch('api.renderers.orjson', None):
+                self.assertEqual(client.get(url).content, fast, url)
+
+
+class RequestProfilerTest(RecipeFeedTestCase):
+    """Профилирование по заголовку X-Profile и выдача профилей."""
+
+    URL = '/api/tags/'
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        profile_dir = override_settings(PROFILE_DIR=directory.name)
+        profile_dir.enable()
+        self.addCleanup(profile_dir.disable)
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@example.com',
+            password='pass12345qq', role='admin'
+        )
+
+    def profile(self, header, client=None):
+        response = (client or APIClient()).get(
+            self.URL, HTTP_X_PROFILE=header
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.get('X-Profile-Id')
+
+    def test_signed_header(self):
+        profile_id = self.profile(sign_header())
+        self.assertEqual(profile_ids(), [profile_id])
+        for kind in ('json', *FILE_KINDS):
+            self.assertTrue(os.path.exists(profile_path(profile_id, kind)))
+
+    def test_rejected_headers(self):
+        signature = sign_header()
+        self.assertIsNone(self.profile(signature[:-1] + 'x'))
+        self.assertIsNone(self.profile('1'))
+        self.assertIsNone(self.profile('1', self.authorized_client()))
+        with override_settings(PROFILE_SIGNATURE_MAX_AGE=-1):
+            self.assertIsNone(self.profile(signature))
+        self.assertEqual(profile_ids(), [])
+
+    def test_admin_header(self):
+        client = self.authorized_client(self.admin)
+        self.assertIsNotNone(self.profile('1', client))
+
+    def test_list_and_download(self):
+        profile_id = self.profile(sign_header())
+        client = self.authorized_client(self.admin)
+        profiles = client.get('/api/profiles/', {'endpoint': 'tag-list'})
+        self.assertEqual(
+            [profile['id'] for profile in profiles.json()], [profile_id]
+        )
+        profiles = client.get('/api/profiles/', {'endpoint': 'recipe-list'})
+        self.assertEqual(profiles.json(), [])
+        url = f'/api/profiles/{profile_id}/download/'
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with open(profile_path(profile_id, 'collapsed'), 'rb') as file:
+            self.assertEqual(b''.join(response.streaming_content),
+                             file.read())
+        response.close()
+        self.assertEqual(
+            self.authorized_client().get(url).status_code, 403
+        )
+
+    def test_download_checks_id_and_kind(self):
+        profile_id = self.profile(sign_header())
+        client = self.authorized_client(self.admin)
+        with open(os.path.join(settings.PROFILE_DIR, 'x.pstats'), 'w'):
+            pass
+        for pk, kind in ((profile_id, 'json'), ('x', 'pstats'),
+                         ('missing', 'collapsed')):
+            response = client.get(
+                f'/api/profiles/{pk}/download/', {'kind': kind}
+            )
+            self.assertEqual(response.status_code, 404, (pk, kind))
+
+
+class ReferenceDataLoadTest(TestCase):
+    """db_load: пропуск по контрольной сумме и повторная загрузка."""
+
+    def setUp(self):
+        clear_caches()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def load(self, *args):
+        output = StringIO()
+        call_command('db_load', *args, stdout=output)
+        return output.getvalue()
+
+    def ingredients(self):
+        return dict(Ingredient.objects.values_list(
+            'name', 'measurement_unit'
+        ))
+
+    def test_checksum_skip_and_force(self):
+        path = self.write(
+            'ingredients.csv', 'соль,г\nсахар,г\n\nмука, кг \n'
+        )
+        self.assertIn('добавлено 3', self.load(path))
+        pks = set(Ingredient.objects.values_list('pk', flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIn('пропущен', self.load(path))
+        self.assertEqual(len(queries), 1)
+        self.assertIn(
+            'добавлено 0, обновлено 0, без изменений 3',
+            self.load(path, '--force')
+        )
+        self.assertEqual(
+            set(Ingredient.objects.values_list('pk', flat=True)), pks
+        )
+        self.assertEqual(self.ingredients()['мука'], 'кг')
+
+    def test_changed_file_upserts(self):
+        path = self.write(
+            'tags.csv', 'Завтрак,#E26C2D,breakfast\nОбед,#49B64E,lunch\n'
+        )
+        self.load(path)
+        lunch = Tag.objects.get(slug='lunch').pk
+        self.write(
+            'tags.csv',
+            'Завтрак,#E26C2D,breakfast\nОбед,#000000,lunch\n'
+            'Ужин,#8775D2,dinner\n'
+        )
+        self.assertIn(
+            'добавлено 1, обновлено 1, без изменений 1', self.load(path)
+        )
+        self.assertEqual(Tag.objects.count(), 3)
+        tag = Tag.objects.get(slug='lunch')
+        self.assertEqual((tag.pk, tag.color), (lunch, '#000000'))
+
+    def test_json_formats_and_chunks(self):
+        items = [
+            {'name': f'перец {number}', 'measurement_unit': 'г'}
+            for number in range(5)
+        ]
+        array = self.write('ingredients.json', json.dumps(items))
+        self.load(array, '--chunk-size', '2')
+        lines = self.write(
+            'ingredients.json', '\n'.join(map(json.dumps, items + [
+                {'name': 'перец 0', 'measurement_unit': 'кг'}
+            ]))
+        )
+        self.assertIn(
+            'добавлено 1, обновлено 0, без изменений 5',
+            self.load(lines, '--chunk-size', '2')
+        )
+        self.assertEqual(Ingredient.objects.count(), 6)
+
+    def test_invalid_file_rolls_back(self):
+        path = self.write(
+            'ingredients.json',
+            '[{"name": "соль", "measurement_unit": "г"}, {"name": '
+        )
+        with self.assertRaises(CommandError):
+            self.load(path)
+        self.assertFalse(Ingredient.objects.exists())
+        self.assertFalse(ReferenceFile.objects.exists())
+        with self.assertRaises(CommandError):
+            self.load(self.write('recipes.csv', ''))
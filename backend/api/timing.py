@@ -0,0 +1,94 @@
+"""Замеры времени запроса: SQL, сериализация, рендеринг.
+
+Метрики текущего запроса хранятся в contextvar, поэтому доступны и в
+потоках пула из concurrency. SQL считает одна обёртка execute_wrapper на
+каждом соединении: она берёт метрики из contextvar выполняющегося кода.
+Под ASGI синхронные части разных запросов делят один поток и одно
+соединение, но контекст у каждого вызова sync_to_async свой, поэтому
+запросы не попадают в чужие метрики. Если замеры выключены, measure и
+record_sql ничего не делают.
+"""
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SQL_LISTS = re.compile(r'\((?:\s*(?:%s|\?)\s*,)*\s*(?:%s|\?)\s*\)')
+
+current_metrics = ContextVar('request_metrics', default=None)
+
+
+def normalize_sql(sql):
+    """Заменяет литералы и списки параметров, чтобы одинаковые запросы
+    с разными значениями сводились к одной строке."""
+    return SQL_LISTS.sub('(...)', SQL_LITERALS.sub('?', sql))
+
+
+class RequestMetrics:
+    def __init__(self, capture_sql=False):
+        self.started = time.perf_counter()
+        self.durations = {}
+        self.sql_count = 0
+        self.sql_time = 0
+        self.capture_sql = capture_sql
+        self.statements = {}
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0) + seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.sql_count += 1
+            self.sql_time += elapsed
+            if self.capture_sql:
+                stats = self.statements.setdefault(normalize_sql(sql), [0, 0])
+                stats[0] += 1
+                stats[1] += elapsed
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def grouped_statements(self, limit):
+        """Запросы, сгруппированные по тексту: сначала самые частые."""
+        return [
+            {'sql': sql, 'count': count, 'ms': round(seconds * 1000, 2)}
+            for sql, (count, seconds) in sorted(
+                self.statements.items(), key=lambda item: -item[1][0]
+            )[:limit]
+        ]
+
+
+@contextmanager
+def measure(name):
+    """Добавляет время выполнения блока к метрике name текущего запроса."""
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(name, time.perf_counter() - start)
+
+
+def record_sql(execute, sql, params, many, context):
+    """Передаёт запрос в метрики текущего запроса, если они есть."""
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_sql_wrapper(sender, connection, **kwargs):
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_sql)
@@ -0,0 +1,82 @@
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http.multipartparser import MultiPartParserError
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image, UnidentifiedImageError
+from rest_framework.fields import ImageField
+
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+MAX_IMAGE_PIXELS = 40_000_000
+IMAGE_SIGNATURES = (
+    b'\xff\xd8\xff',
+    b'\x89PNG\r\n\x1a\n',
+    b'GIF87a',
+    b'GIF89a',
+)
+BASE64_HEADER_SIZE = 64
+
+
+def is_image_header(data):
+    return data.startswith(IMAGE_SIGNATURES)
+
+
+class ImageUploadError(MultiPartParserError):
+    pass
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загружаемый файл во временный файл по частям.
+
+    По первому чанку проверяет сигнатуру формата, по мере чтения — размер,
+    поэтому неподходящий файл отклоняется до того, как будет прочитан
+    целиком.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0 and not is_image_header(raw_data):
+            raise ImageUploadError('Файл не является изображением')
+        self.received += len(raw_data)
+        if self.received > MAX_IMAGE_SIZE:
+            raise ImageUploadError(
+                f'Размер изображения превышает {MAX_IMAGE_SIZE} байт'
+            )
+        return super().receive_data_chunk(raw_data, start)
+
+
+def check_pixels(file):
+    """Проверяет число пикселей по заголовку, не декодируя изображение."""
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+    except (UnidentifiedImageError, OSError):
+        raise ValidationError('Загрузите корректное изображение.')
+    finally:
+        file.seek(0)
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ValidationError(
+            f'Изображение больше {MAX_IMAGE_PIXELS} пикселей'
+        )
+
+
+class RecipeImageField(Base64ImageField):
+    """Изображение строкой base64 или файлом из multipart/form-data."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            check_pixels(data)
+            return ImageField.to_internal_value(self, data)
+        if (isinstance(data, str)
+                and len(data) > MAX_IMAGE_SIZE * 4 // 3 + BASE64_HEADER_SIZE):
+            raise ValidationError(
+                f'Размер изображения превышает {MAX_IMAGE_SIZE} байт'
+            )
+        value = super().to_internal_value(data)
+        if value is not None:
+            check_pixels(value)
+        return value
@@ -1,7 +1,10 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (RecipeViewSet, TagViewSet, IngredientViewSet)
+from .concurrency import with_concurrent_reads
+from .metrics import metrics_view
+from .views import (RecipeViewSet, TagViewSet, IngredientViewSet,
+                    ProfileViewSet)
 
 app_name = 'api'
 
@@ -9,7 +12,9 @@ router = DefaultRouter()
 router.register('tags', TagViewSet)
 router.register('ingredients', IngredientViewSet)
 router.register('recipes', RecipeViewSet)
+router.register('profiles', ProfileViewSet, basename='profiles')
 
 urlpatterns = [
-    path('', include(router.urls)),
+    path('metrics', metrics_view, name='metrics'),
+    path('', include(with_concurrent_reads(router.urls))),
 ]
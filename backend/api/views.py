@@ -1,30 +1,74 @@
-import csv
+import time
 
-from django.http import HttpResponse
+from django.db import transaction
+from django.http import FileResponse, Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.filters import OrderingFilter
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from .filters import AuthorAndTagFilter, IngredientSearchFilter
-from .pagination import LimitPageNumberPagination
-from .permissions import IsAdminOrReadOnly, IsAuthorOrReadOnly
+from .catalogue import catalogue_response
+from .filters import AuthorAndTagFilter
+from .ingredient_index import ingredient_index
+from .pagination import RecipePagination
+from .response_cache import cached_response
+from .permissions import IsAdmin, IsAdminOrReadOnly, IsAuthorOrReadOnly
+from .profiling import FILE_KINDS, load_profiles, profile_ids, profile_path
+from .shopping_list import (CONTENT_TYPES, RENDERERS,
+                            IgnoreFormatContentNegotiation, get_shopping_list)
+from .uploads import ImageUploadHandler
 from .serializers import (TagSerializer, IngredientSerializer,
                           RecipeListSerializer, RecipeCreateSerializer,
                           CartSerializer, FavoriteSerializer)
-from foodgram.models import Recipe, Tag, Ingredient, Amount, Cart, Favorite
+from foodgram.models import Recipe, Tag, Ingredient, Cart, Favorite
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
-    pagination_class = LimitPageNumberPagination
-    filter_backends = (DjangoFilterBackend,)
+    pagination_class = RecipePagination
+    filter_backends = (DjangoFilterBackend, OrderingFilter)
     filter_class = AuthorAndTagFilter
+    ordering_fields = ('pub_date', 'favorites_count', 'cart_count')
+    parser_classes = (JSONParser, FormParser, MultiPartParser)
     permission_classes = (IsAuthorOrReadOnly, )
 
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [ImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        self.started = time.time_ns()
+        super().initial(request, *args, **kwargs)
+
+    def get_queryset(self):
+        if self.request.method == 'GET':
+            return Recipe.objects.select_related('author')
+        return Recipe.objects.with_related()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['started'] = getattr(self, 'started', None)
+        return context
+
+    def list(self, request, *args, **kwargs):
+        return cached_response(
+            self, request, lambda: super(RecipeViewSet, self).list(
+                request, *args, **kwargs
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(
+            self, request, lambda: super(RecipeViewSet, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
+
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return RecipeListSerializer
@@ -34,43 +78,31 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer.save(author=self.request.user)
 
     @action(
-        detail=False, methods=['get'], permission_classes=[IsAuthenticated]
+        detail=False, methods=['get'], permission_classes=[IsAuthenticated],
+        content_negotiation_class=IgnoreFormatContentNegotiation
     )
     def download_shopping_cart(self, request, pk=None):
-        shopping_cart_obj = request.user.cart.all()
-        cart_dict = {}
-        for obj in shopping_cart_obj:
-            recipes = obj.recipe
-            ingredients = obj.recipe.ingredients.all()
-            for ingredient in ingredients:
-                amounts = Amount.objects.filter(
-                    recipe=recipes, ingredient=ingredient
-                )
-                for amount in amounts:
-                    if ingredient not in cart_dict:
-                        cart_dict[ingredient] = amount.amount
-                    else:
-                        cart_dict[ingredient] = (amount.amount +
-                                                 cart_dict[ingredient])
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = ('attachment; '
-                                           'filename="shopping_list.csv"')
-        writer = csv.writer(response, lineterminator="\r")
-        count = 0
-        for ingredient, amount in cart_dict.items():
-            count += 1
-            writer.writerow(
-                [
-                    f'{count}. {str(ingredient.name).capitalize()} '
-                    f'({ingredient.measurement_unit}) - {amount}\n'
-                ]
+        file_format = request.query_params.get('format', 'csv')
+        if file_format not in RENDERERS:
+            return Response(
+                {'error': f'Неподдерживаемый формат файла: "{file_format}"'},
+                status=status.HTTP_400_BAD_REQUEST
             )
+        rows = get_shopping_list(request.user).iterator()
+        response = StreamingHttpResponse(
+            RENDERERS[file_format](rows),
+            content_type=f'{CONTENT_TYPES[file_format]}; charset=utf-8'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{file_format}"'
+        )
         return response
 
     @action(
         detail=True, methods=['post', 'delete'],
         permission_classes=[IsAuthenticated]
     )
+    @transaction.atomic
     def shopping_cart(self, request, pk=None):
         request.data['user'] = self.request.user.id
         request.data['recipe'] = self.kwargs.get('pk')
@@ -95,6 +127,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         detail=True, methods=['post', 'delete'],
         permission_classes=[IsAuthenticated]
     )
+    @transaction.atomic
     def favorite(self, request, pk=None):
         request.data['user'] = self.request.user.id
         request.data['recipe'] = self.kwargs.get('pk')
@@ -121,10 +154,66 @@ class TagViewSet(viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     permission_classes = (IsAdminOrReadOnly, )
 
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        return catalogue_response(request, 'tags')
+
 
 class IngredientViewSet(viewsets.ModelViewSet):
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
     permission_classes = (IsAdminOrReadOnly,)
-    filter_backends = (IngredientSearchFilter,)
-    search_fields = ('^name',)
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        return catalogue_response(request, 'ingredients')
+
+
+class ProfileViewSet(viewsets.ViewSet):
+    """Сохранённые профили запросов: фильтр по endpoint и min_ms,
+    сортировка ordering=duration или -duration."""
+    permission_classes = (IsAdmin,)
+
+    def list(self, request):
+        profiles = load_profiles()
+        endpoint = request.query_params.get('endpoint')
+        if endpoint:
+            profiles = [
+                profile for profile in profiles
+                if profile['endpoint'] == endpoint
+            ]
+        min_ms = request.query_params.get('min_ms')
+        if min_ms:
+            try:
+                min_ms = float(min_ms)
+            except ValueError:
+                return Response(
+                    {'min_ms': 'Ожидается число.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            profiles = [
+                profile for profile in profiles
+                if profile['duration_ms'] >= min_ms
+            ]
+        ordering = request.query_params.get('ordering')
+        if ordering in ('duration', '-duration'):
+            profiles.sort(
+                key=lambda profile: profile['duration_ms'],
+                reverse=ordering == '-duration'
+            )
+        return Response(profiles)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        kind = request.query_params.get('kind', 'collapsed')
+        if kind not in FILE_KINDS or pk not in profile_ids():
+            raise Http404
+        return FileResponse(
+            open(profile_path(pk, kind), 'rb'), as_attachment=True,
+            filename=f'{pk}.{kind}'
+        )
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from .models import (Recipe, Amount, Cart, Tag,
-                     Favorite, Follow, Ingredient)
+                     Favorite, Follow, Ingredient, ImageJob)
 
 
 class AmountInline(admin.TabularInline):
@@ -22,7 +22,7 @@ class RecipeAdmin(admin.ModelAdmin):
     readonly_fields = ('get_add_to_favorite_count',)
 
     def get_add_to_favorite_count(self, instance):
-        return (instance.favorites.count())
+        return instance.favorites_count
 
     get_add_to_favorite_count.short_description = (
         'Количество добавлений в избранное'
@@ -53,3 +53,9 @@ class IngredientAdmin(admin.ModelAdmin):
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     list_display = ['name', 'color', 'slug']
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'recipe', 'status', 'attempts', 'updated']
+    list_filter = ('status',)
@@ -0,0 +1,131 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO
+
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import ImageJob, Recipe
+from .signals import recipes_changed
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = (320, 640, 1280)
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+VARIANTS_DIR = 'recipes/variants'
+MAX_ATTEMPTS = 3
+# Задача в статусе processing дольше этого срока (в секундах) считается
+# брошенной упавшим процессом и может быть взята снова.
+LEASE_TIMEOUT = 10 * 60
+WORKERS = 2
+
+executor = ThreadPoolExecutor(
+    max_workers=WORKERS, thread_name_prefix='recipe-images'
+)
+
+
+def schedule_image_processing(recipe):
+    """Ставит изображение рецепта в очередь после фиксации транзакции."""
+    job = ImageJob.objects.create(recipe=recipe, image=recipe.image.name)
+    transaction.on_commit(lambda: executor.submit(run_in_worker, job.pk))
+    return job
+
+
+def make_variants(name):
+    """Уменьшает изображение до WIDTHS и пересжимает в WEBP и JPEG.
+
+    Метаданные (EXIF, ICC) в копии не переносятся.
+    """
+    with default_storage.open(name) as source:
+        image = Image.open(source)
+        image.load()
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    base = os.path.splitext(os.path.basename(name))[0]
+    variants = {}
+    for width in WIDTHS:
+        if width >= image.width and variants:
+            break
+        resized = image.copy()
+        resized.thumbnail((width, width * 4), Image.LANCZOS)
+        for extension, (image_format, params) in FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, image_format, **params)
+            path = default_storage.save(
+                f'{VARIANTS_DIR}/{base}_{width}.{extension}',
+                ContentFile(buffer.getvalue())
+            )
+            variants.setdefault(str(width), {})[extension] = path
+    return variants
+
+
+def import_image(name, source_dir=None, variants=False):
+    """Копирует изображение из source_dir в хранилище, если его там ещё
+    нет, и при variants строит уменьшенные копии. Не обращается к БД,
+    поэтому import_recipes может вызывать её в пуле процессов."""
+    if source_dir and not default_storage.exists(name):
+        with open(os.path.join(source_dir, name), 'rb') as source:
+            name = default_storage.save(
+                Recipe._meta.get_field('image').generate_filename(
+                    None, os.path.basename(name)
+                ),
+                File(source)
+            )
+    if variants and default_storage.exists(name):
+        return name, make_variants(name)
+    return name, {}
+
+
+def process_job(job_id):
+    try:
+        claimed = ImageJob.objects.filter(
+            pk=job_id,
+            status__in=(ImageJob.PENDING, ImageJob.FAILED),
+            attempts__lt=MAX_ATTEMPTS
+        ).update(
+            status=ImageJob.PROCESSING, attempts=F('attempts') + 1,
+            updated=timezone.now()
+        )
+        if not claimed:
+            return
+        job = ImageJob.objects.get(pk=job_id)
+        variants = make_variants(job.image)
+        Recipe.objects.filter(pk=job.recipe_id, image=job.image).update(
+            image_variants=variants
+        )
+        recipes_changed.send(sender=Recipe, recipe_ids=[job.recipe_id])
+        ImageJob.objects.filter(pk=job_id).update(
+            status=ImageJob.DONE, error='', updated=timezone.now()
+        )
+    except Exception as error:
+        logger.exception('Ошибка обработки изображения, задача %s', job_id)
+        ImageJob.objects.filter(pk=job_id).update(
+            status=ImageJob.FAILED, error=str(error), updated=timezone.now()
+        )
+
+
+def reclaim_stale_jobs():
+    """Возвращает в очередь задачи, брошенные в статусе processing дольше
+    LEASE_TIMEOUT секунд назад. Задачи, которые сейчас обрабатывает
+    другой процесс, не трогает."""
+    now = timezone.now()
+    return ImageJob.objects.filter(
+        status=ImageJob.PROCESSING,
+        updated__lt=now - timedelta(seconds=LEASE_TIMEOUT)
+    ).update(status=ImageJob.FAILED, error='Прервано', updated=now)
+
+
+def run_in_worker(job_id):
+    """Обрабатывает задачу в потоке пула и закрывает его соединения с БД."""
+    try:
+        process_job(job_id)
+    finally:
+        connections.close_all()
@@ -1,44 +1,178 @@
 import csv
+import hashlib
+import json
+import os
+from itertools import islice
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
 
+from foodgram.models import Ingredient, ReferenceFile, Tag
+from foodgram.signals import reference_data_changed
 
-from foodgram.models import Ingredient, Tag
-
+DATA_DIR = os.path.join(settings.BASE_DIR, 'data')
+DEFAULT_FILES = ('ingredients.csv', 'tags.csv')
+# Модель, естественный ключ и колонки CSV-файла без заголовка.
 TABLES = {
-    Ingredient: 'ingredients.csv',
-    Tag: 'tags.csv',
+    'ingredients': (
+        Ingredient, ('name', 'measurement_unit'), ('name', 'measurement_unit')
+    ),
+    'tags': (Tag, ('slug',), ('name', 'color', 'slug')),
 }
+READ_SIZE = 64 * 1024
+
+
+def file_checksum(path):
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(READ_SIZE), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def read_csv(file, columns):
+    for row in csv.reader(file):
+        if row:
+            yield dict(zip(columns, (value.strip() for value in row)))
+
+
+def read_json(file):
+    """Объекты из JSON-массива или JSON Lines, без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    while True:
+        chunk = file.read(READ_SIZE)
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+                position += 1
+            if position == len(buffer):
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise
+                break
+            yield item
+        buffer = buffer[position:]
+        if not chunk:
+            return
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def upsert(model, key_fields, rows, chunk_size):
+    """Добавляет новые и обновляет изменившиеся записи по естественному
+    ключу. Возвращает число добавленных, обновлённых, неизменных записей
+    и id обновлённых."""
+    inserted = unchanged = 0
+    updated_ids = []
+    for chunk in chunked(rows, chunk_size):
+        rows_by_key = {
+            tuple(row[field] for field in key_fields): row for row in chunk
+        }
+        existing = {}
+        for instance in model.objects.filter(**{
+            f'{key_fields[0]}__in': {key[0] for key in rows_by_key}
+        }).order_by('pk'):
+            key = tuple(getattr(instance, field) for field in key_fields)
+            existing.setdefault(key, instance)
+        created, changed, fields = [], [], set()
+        for key, row in rows_by_key.items():
+            instance = existing.get(key)
+            if instance is None:
+                created.append(model(**row))
+                continue
+            differs = [
+                field for field, value in row.items()
+                if getattr(instance, field) != value
+            ]
+            if not differs:
+                unchanged += 1
+                continue
+            for field in differs:
+                setattr(instance, field, row[field])
+            fields.update(differs)
+            changed.append(instance)
+        model.objects.bulk_create(created)
+        if changed:
+            model.objects.bulk_update(changed, fields)
+        inserted += len(created)
+        updated_ids.extend(instance.pk for instance in changed)
+    return inserted, len(updated_ids), unchanged, updated_ids
 
 
 class Command(BaseCommand):
+    help = (
+        'Загружает справочники ингредиентов и тегов из CSV или JSON. '
+        'Повторный запуск не создаёт дублей, а неизменившиеся файлы '
+        'пропускаются по контрольной сумме'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'files', nargs='*', default=DEFAULT_FILES,
+            help='Файлы ingredients.* и tags.*, по умолчанию из data/'
+        )
+        parser.add_argument('--force', action='store_true',
+                            help='Загрузить даже неизменившиеся файлы')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
     def handle(self, *args, **options):
-        for model, csv_f in TABLES.items():
-            lines = 0
-            file = open(f'{settings.BASE_DIR}/data/{csv_f}')
-            for line in file:
-                lines += 1
-            with open(
-                    f'{settings.BASE_DIR}/data/{csv_f}', 'r',
-            ) as read_object, open(
-                f'{settings.BASE_DIR}/data/temp.csv', 'w'
-            ) as write_object:
-                if csv_f == 'tags.csv':
-                    write_object.write('id,name,color,slug\n')
-                else:
-                    write_object.write('id,name,measurement_unit\n')
-                for idx, line in enumerate(read_object, start=1):
-                    write_object.write(f'{idx},{line}')
-            with open(
-                f'{settings.BASE_DIR}/data/temp.csv',
-                'r',
-                encoding='utf-8'
-            ) as csv_file:
-                reader = csv.DictReader(csv_file)
-                model.objects.bulk_create(
-                    model(**data) for data in reader
+        for name in options['files']:
+            self.load(
+                os.path.join(DATA_DIR, name), options['force'],
+                options['chunk_size']
+            )
+
+    def load(self, path, force, chunk_size):
+        name = os.path.basename(path)
+        table, extension = os.path.splitext(name)
+        if table not in TABLES or extension not in ('.csv', '.json'):
+            raise CommandError(
+                f'{name}: ожидается ingredients или tags в CSV или JSON'
+            )
+        if not os.path.exists(path):
+            raise CommandError(f'{path}: файл не найден')
+        model, key_fields, columns = TABLES[table]
+        checksum = file_checksum(path)
+        if not force and ReferenceFile.objects.filter(
+            name=name, checksum=checksum
+        ).exists():
+            self.stdout.write(f'{name}: не изменился, пропущен')
+            return
+        with transaction.atomic(), open(path, encoding='utf-8') as file:
+            if extension == '.csv':
+                rows = read_csv(file, columns)
+            else:
+                rows = (
+                    {field: item[field] for field in columns if field in item}
+                    for item in read_json(file)
                 )
-            self.stdout.write(
-                self.style.SUCCESS(f'Все данные из файла {csv_f} загружены')
+            try:
+                inserted, updated, unchanged, updated_ids = upsert(
+                    model, key_fields, rows, chunk_size
+                )
+            except (ValueError, KeyError, TypeError) as error:
+                raise CommandError(f'{name}: неверный формат: {error}')
+            ReferenceFile.objects.update_or_create(
+                name=name, defaults={'checksum': checksum}
+            )
+        if inserted or updated:
+            reference_data_changed.send(
+                sender=model, updated_ids=updated_ids
             )
+        self.stdout.write(self.style.SUCCESS(
+            f'{name}: добавлено {inserted}, обновлено {updated}, '
+            f'без изменений {unchanged}'
+        ))
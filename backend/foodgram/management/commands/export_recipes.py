@@ -0,0 +1,96 @@
+import json
+import time
+from collections import defaultdict
+
+from django.core.management import BaseCommand
+
+from foodgram.models import Amount, Recipe
+
+RECIPE_FIELDS = (
+    'pk', 'author__email', 'name', 'text', 'cooking_time', 'pub_date',
+    'image',
+)
+
+
+def recipe_chunks(chunk_size):
+    """Рецепты пачками по возрастанию id, без OFFSET и без загрузки всей
+    таблицы в память."""
+    last_pk = 0
+    while True:
+        chunk = list(
+            Recipe.objects.filter(pk__gt=last_pk).order_by('pk').values(
+                *RECIPE_FIELDS
+            )[:chunk_size]
+        )
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1]['pk']
+
+
+def export_records(chunk):
+    ids = [recipe['pk'] for recipe in chunk]
+    tags = defaultdict(list)
+    for recipe_id, slug in Recipe.tags.through.objects.filter(
+        recipe_id__in=ids
+    ).order_by('pk').values_list('recipe_id', 'tag__slug'):
+        tags[recipe_id].append(slug)
+    ingredients = defaultdict(list)
+    for recipe_id, name, unit, amount in Amount.objects.filter(
+        recipe_id__in=ids
+    ).order_by('pk').values_list(
+        'recipe_id', 'ingredient__name', 'ingredient__measurement_unit',
+        'amount'
+    ):
+        ingredients[recipe_id].append(
+            {'name': name, 'measurement_unit': unit, 'amount': amount}
+        )
+    for recipe in chunk:
+        yield {
+            'author': recipe['author__email'],
+            'name': recipe['name'],
+            'text': recipe['text'],
+            'cooking_time': recipe['cooking_time'],
+            'pub_date': recipe['pub_date'].isoformat(),
+            'image': recipe['image'],
+            'tags': tags[recipe['pk']],
+            'ingredients': ingredients[recipe['pk']],
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает рецепты в JSON Lines: по рецепту на строку, автор по '
+        'email, теги по slug, ингредиенты по названию и единице, '
+        'изображение — путём в хранилище'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', nargs='?', default='-',
+                            help='Файл для выгрузки, «-» — stdout')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        exported = 0
+        to_stdout = options['output'] == '-'
+        output = (
+            self.stdout if to_stdout
+            else open(options['output'], 'w', encoding='utf-8')
+        )
+        try:
+            for chunk in recipe_chunks(options['chunk_size']):
+                for record in export_records(chunk):
+                    output.write(
+                        json.dumps(record, ensure_ascii=False) + '\n'
+                    )
+                exported += len(chunk)
+        finally:
+            if not to_stdout:
+                output.close()
+        elapsed = time.perf_counter() - started
+        self.stderr.write(
+            f'Выгружено рецептов: {exported} за {elapsed:.1f} с, '
+            f'{exported / elapsed:.0f} рецептов/с',
+            style_func=self.style.SUCCESS
+        )
@@ -0,0 +1,81 @@
+import posixpath
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from foodgram.models import ImageJob, Recipe
+
+MEDIA_DIRS = ('recipes',)
+
+
+def walk(storage, directory):
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+def referenced_names():
+    names = set()
+    for image, variants in Recipe.objects.values_list(
+        'image', 'image_variants'
+    ).iterator():
+        names.add(image)
+        for formats in variants.values():
+            names.update(formats.values())
+    names.update(
+        ImageJob.objects.exclude(status=ImageJob.DONE).values_list(
+            'image', flat=True
+        )
+    )
+    return names
+
+
+class Command(BaseCommand):
+    help = 'Удаляет файлы из MEDIA_ROOT, на которые не ссылаются рецепты'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько файлов удалять за один проход'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=24,
+            help='Не трогать файлы моложе указанного числа часов'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено'
+        )
+
+    def handle(self, *args, **options):
+        referenced = referenced_names()
+        threshold = timezone.now() - timedelta(hours=options['min_age'])
+        batch = []
+        deleted = 0
+        for directory in MEDIA_DIRS:
+            if not default_storage.exists(directory):
+                continue
+            for name in walk(default_storage, directory):
+                if name in referenced:
+                    continue
+                if default_storage.get_modified_time(name) > threshold:
+                    continue
+                batch.append(name)
+                if len(batch) >= options['batch_size']:
+                    deleted += self.delete(batch, options['dry_run'])
+                    batch = []
+        deleted += self.delete(batch, options['dry_run'])
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(f'{action} файлов: {deleted}'))
+
+    def delete(self, names, dry_run):
+        for name in names:
+            if dry_run:
+                self.stdout.write(name)
+            else:
+                default_storage.delete(name)
+        return len(names)
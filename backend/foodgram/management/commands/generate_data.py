@@ -0,0 +1,221 @@
+import random
+from datetime import timedelta
+from io import BytesIO
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from foodgram.models import (Amount, Cart, Favorite, Follow, Ingredient,
+                             Recipe, Tag)
+from foodgram.search import update_search_index
+from foodgram.signals import recipes_changed
+from users.models import User
+
+PASSWORD = 'synthetic-password'
+MIN_INGREDIENTS = 3
+MAX_INGREDIENTS = 15
+MODE_INGREDIENTS = 7
+DEFAULT_TAGS = (
+    ('Завтрак', '#FFFF00', 'breakfast'),
+    ('Обед', '#00FF00', 'lunch'),
+    ('Ужин', '#0000FF', 'dinner'),
+)
+WORDS = (
+    'суп', 'салат', 'пирог', 'рагу', 'каша', 'запеканка', 'омлет', 'паста',
+    'плов', 'котлеты', 'блины', 'соус', 'с грибами', 'с курицей',
+    'по-домашнему', 'с овощами', 'острый', 'сливочный', 'быстрый', 'летний',
+)
+
+
+def popularity_weights(size):
+    """Накопленные веса по закону Ципфа: немногие элементы собирают
+    большую часть избранного и подписок, как на живом сайте."""
+    return list(accumulate(1 / rank for rank in range(1, size + 1)))
+
+
+def sample(rng, population, cum_weights, count):
+    """До count разных элементов population с учётом весов."""
+    count = min(count, len(population))
+    chosen = set()
+    for _ in range(count * 4):
+        if len(chosen) >= count:
+            break
+        chosen.add(rng.choices(population, cum_weights=cum_weights)[0])
+    return chosen
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует воспроизводимый по seed набор пользователей, рецептов, '
+        'избранного, корзин и подписок для нагрузочных замеров'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Среднее число избранных на пользователя')
+        parser.add_argument('--carts', type=int, default=5,
+                            help='Среднее число рецептов в корзине')
+        parser.add_argument('--follows', type=int, default=5,
+                            help='Среднее число подписок на пользователя')
+        parser.add_argument('--ingredients', type=int, default=500,
+                            help='Сколько ингредиентов создать, если их нет')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        prefix = f'synth{options["seed"]}_'
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Данные с seed={options["seed"]} уже сгенерированы'
+            )
+        with transaction.atomic():
+            tags = self.ensure_tags()
+            ingredients = self.ensure_ingredients(options['ingredients'])
+            users = self.create_users(prefix, options['users'])
+            recipes = self.create_recipes(
+                rng, users, tags, ingredients, options['recipes']
+            )
+            self.create_links(
+                rng, Favorite, users, recipes, options['favorites']
+            )
+            self.create_links(rng, Cart, users, recipes, options['carts'])
+            self.create_follows(rng, users, options['follows'])
+            recipe_ids = [recipe.pk for recipe in recipes]
+            update_search_index(recipe_ids)
+            recipes_changed.send(sender=Recipe, recipe_ids=recipe_ids)
+        call_command('rebuild_counters', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(users)}, рецептов: {len(recipes)}. '
+            f'Пароль пользователей: {PASSWORD}'
+        ))
+
+    def ensure_tags(self):
+        for name, color, slug in DEFAULT_TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color}
+            )
+        return list(Tag.objects.order_by('pk'))
+
+    def ensure_ingredients(self, count):
+        if not Ingredient.objects.exists():
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(
+                        name=f'ингредиент {number}', measurement_unit='г'
+                    )
+                    for number in range(1, count + 1)
+                ),
+                batch_size=self.batch_size
+            )
+        return list(Ingredient.objects.order_by('pk').values_list(
+            'pk', flat=True
+        ))
+
+    def create_users(self, prefix, count):
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'{prefix}{number}',
+                    email=f'{prefix}{number}@example.com',
+                    first_name=f'Имя{number}',
+                    last_name=f'Фамилия{number}',
+                    password=password,
+                )
+                for number in range(count)
+            ),
+            batch_size=self.batch_size
+        )
+        return list(User.objects.filter(
+            username__startswith=prefix
+        ).order_by('pk'))
+
+    def placeholder_image(self):
+        buffer = BytesIO()
+        Image.new('RGB', (64, 48), (200, 120, 60)).save(buffer, 'JPEG')
+        return default_storage.save(
+            'recipes/synthetic.jpg', ContentFile(buffer.getvalue())
+        )
+
+    def create_recipes(self, rng, users, tags, ingredients, count):
+        image = self.placeholder_image()
+        authors = [
+            user for user in users
+            for _ in range(max(1, int(rng.paretovariate(1.5))))
+        ]
+        now = timezone.now()
+        recipes = []
+        for number in range(count):
+            recipes.append(Recipe(
+                author=rng.choice(authors),
+                name=' '.join(rng.sample(WORDS, 2)).capitalize(),
+                image=image,
+                text=' '.join(rng.choices(WORDS, k=rng.randint(10, 60))),
+                cooking_time=rng.randint(5, 180),
+            ))
+        Recipe.objects.bulk_create(recipes, batch_size=self.batch_size)
+        if not recipes or recipes[0].pk is None:
+            recipes = list(Recipe.objects.filter(
+                author__in=users
+            ).order_by('pk'))
+        for recipe in recipes:
+            recipe.pub_date = now - timedelta(
+                minutes=rng.randint(0, 60 * 24 * 365)
+            )
+        Recipe.objects.bulk_update(
+            recipes, ('pub_date',), batch_size=self.batch_size
+        )
+        weights = popularity_weights(len(ingredients))
+        amounts = []
+        recipe_tags = []
+        for recipe in recipes:
+            size = round(rng.triangular(
+                MIN_INGREDIENTS, MAX_INGREDIENTS, MODE_INGREDIENTS
+            ))
+            for ingredient_id in sample(rng, ingredients, weights, size):
+                amounts.append(Amount(
+                    recipe=recipe, ingredient_id=ingredient_id,
+                    amount=rng.choice((1, 2, 3, 5, 10, 50, 100, 200, 500))
+                ))
+            for tag in rng.sample(tags, rng.randint(1, min(2, len(tags)))):
+                recipe_tags.append(
+                    Recipe.tags.through(recipe=recipe, tag=tag)
+                )
+        Amount.objects.bulk_create(amounts, batch_size=self.batch_size)
+        Recipe.tags.through.objects.bulk_create(
+            recipe_tags, batch_size=self.batch_size
+        )
+        return recipes
+
+    def create_links(self, rng, model, users, recipes, average):
+        weights = popularity_weights(len(recipes))
+        shuffled = recipes[:]
+        rng.shuffle(shuffled)
+        links = []
+        for user in users:
+            count = int(rng.expovariate(1 / average)) if average else 0
+            for recipe in sample(rng, shuffled, weights, count):
+                links.append(model(user=user, recipe=recipe))
+        model.objects.bulk_create(links, batch_size=self.batch_size)
+
+    def create_follows(self, rng, users, average):
+        weights = popularity_weights(len(users))
+        authors = users[:]
+        rng.shuffle(authors)
+        follows = []
+        for user in users:
+            count = int(rng.expovariate(1 / average)) if average else 0
+            for author in sample(rng, authors, weights, count):
+                if author != user:
+                    follows.append(Follow(user=user, author=author))
+        Follow.objects.bulk_create(follows, batch_size=self.batch_size)
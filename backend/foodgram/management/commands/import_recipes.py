@@ -0,0 +1,210 @@
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from foodgram.images import import_image
+from foodgram.models import Amount, Ingredient, Recipe, Tag
+from foodgram.search import update_search_index
+from foodgram.signals import recipes_changed
+from users.models import User
+
+MAX_REPORTED_ERRORS = 20
+
+
+def read_lines(path):
+    with open(path, encoding='utf-8') as file:
+        for number, line in enumerate(file, start=1):
+            if line.strip():
+                yield number, line
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает рецепты из JSON Lines, выгруженных export_recipes. '
+        'Авторы, теги и ингредиенты должны уже быть в базе'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Файл JSON Lines')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument(
+            '--images-dir',
+            help='Каталог с файлами изображений (MEDIA_ROOT исходного '
+                 'окружения); недостающие в хранилище копируются из него'
+        )
+        parser.add_argument(
+            '--image-workers', type=int, default=0,
+            help='Число процессов для копирования изображений и '
+                 'построения уменьшенных копий; 0 — копировать в текущем '
+                 'процессе, копии построит process_images --backfill'
+        )
+
+    def handle(self, *args, **options):
+        self.authors = dict(User.objects.values_list('email', 'pk'))
+        self.tags = dict(Tag.objects.values_list('slug', 'pk'))
+        self.ingredients = {
+            (name, unit): pk for name, unit, pk in
+            Ingredient.objects.values_list('name', 'measurement_unit', 'pk')
+        }
+        self.images_dir = options['images_dir']
+        self.errors = 0
+        executor = None
+        if options['image_workers']:
+            executor = ProcessPoolExecutor(
+                options['image_workers'], initializer=django.setup
+            )
+        started = time.perf_counter()
+        imported = 0
+        chunk = []
+        try:
+            for number, line in read_lines(options['input']):
+                record = self.parse(number, line)
+                if record is None:
+                    continue
+                chunk.append(record)
+                if len(chunk) >= options['chunk_size']:
+                    imported += self.import_chunk(chunk, executor)
+                    chunk = []
+                    self.report(imported, started)
+            if chunk:
+                imported += self.import_chunk(chunk, executor)
+        except FileNotFoundError as error:
+            raise CommandError(error)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            # Пачки фиксируются по отдельности, поэтому счётчики
+            # пересчитываются и после прерванной загрузки.
+            if imported:
+                call_command('rebuild_counters', stdout=self.stdout)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено рецептов: {imported}, пропущено: {self.errors}, '
+            f'{elapsed:.1f} с, {imported / elapsed:.0f} рецептов/с'
+        ))
+        if executor is None:
+            self.stdout.write(
+                'Уменьшенные копии изображений: '
+                'python manage.py process_images --backfill'
+            )
+
+    def report(self, imported, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{imported} рецептов, {imported / elapsed:.0f} рецептов/с'
+        )
+
+    def error(self, number, message):
+        self.errors += 1
+        if self.errors <= MAX_REPORTED_ERRORS:
+            self.stderr.write(f'Строка {number}: {message}')
+
+    def parse(self, number, line):
+        """Проверяет строку и заменяет ссылки на id; None — пропустить."""
+        try:
+            data = json.loads(line)
+            author = self.authors.get(data['author'])
+            if author is None:
+                self.error(number, f'нет автора {data["author"]}')
+                return None
+            tags = [self.tags.get(slug) for slug in data['tags']]
+            if None in tags:
+                self.error(number, f'нет тегов {data["tags"]}')
+                return None
+            amounts = []
+            for item in data['ingredients']:
+                key = (item['name'], item['measurement_unit'])
+                if key not in self.ingredients:
+                    self.error(number, f'нет ингредиента {key}')
+                    return None
+                amounts.append((self.ingredients[key], int(item['amount'])))
+            pub_date = timezone.now()
+            if data.get('pub_date'):
+                pub_date = parse_datetime(data['pub_date'])
+                if pub_date is None:
+                    self.error(number, f'неверная дата {data["pub_date"]!r}')
+                    return None
+                if timezone.is_naive(pub_date):
+                    pub_date = timezone.make_aware(pub_date)
+            return {
+                'number': number,
+                'recipe': Recipe(
+                    author_id=author,
+                    name=data['name'],
+                    text=data['text'],
+                    cooking_time=int(data['cooking_time']),
+                    image=data['image'],
+                ),
+                'pub_date': pub_date,
+                'tags': dict.fromkeys(tags),
+                'amounts': dict(amounts),
+            }
+        except (ValueError, KeyError, TypeError) as error:
+            self.error(number, f'неверный формат: {error!r}')
+            return None
+
+    def prepare_images(self, chunk, executor):
+        """Копирует изображения пачки; записи, изображение которых не
+        удалось скопировать или обработать, пропускаются."""
+        names = [record['recipe'].image.name for record in chunk]
+        if executor is not None:
+            results = [
+                executor.submit(import_image, name, self.images_dir, True)
+                .result for name in names
+            ]
+        else:
+            results = [
+                partial(import_image, name, self.images_dir)
+                for name in names
+            ]
+        prepared = []
+        for record, result in zip(chunk, results):
+            try:
+                name, variants = result()
+            except (OSError, ValueError) as error:
+                self.error(record['number'], f'изображение: {error}')
+                continue
+            record['recipe'].image = name
+            record['recipe'].image_variants = variants
+            prepared.append(record)
+        return prepared
+
+    def import_chunk(self, chunk, executor):
+        chunk = self.prepare_images(chunk, executor)
+        if not chunk:
+            return 0
+        recipes = [record['recipe'] for record in chunk]
+        with transaction.atomic():
+            if not connection.features.can_return_rows_from_bulk_insert:
+                # SQLite в Django 3.2 не возвращает id из bulk_create,
+                # поэтому id назначаются явно внутри транзакции.
+                last_pk = Recipe.objects.aggregate(last=Max('pk'))['last']
+                for number, recipe in enumerate(recipes, start=1):
+                    recipe.pk = (last_pk or 0) + number
+            Recipe.objects.bulk_create(recipes)
+            # auto_now_add перезаписывает pub_date при вставке.
+            for record in chunk:
+                record['recipe'].pub_date = record['pub_date']
+            Recipe.objects.bulk_update(recipes, ('pub_date',))
+            Amount.objects.bulk_create(
+                Amount(recipe=record['recipe'], ingredient_id=pk,
+                       amount=amount)
+                for record in chunk
+                for pk, amount in record['amounts'].items()
+            )
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe=record['recipe'], tag_id=pk)
+                for record in chunk for pk in record['tags']
+            )
+            recipe_ids = [recipe.pk for recipe in recipes]
+            update_search_index(recipe_ids)
+            recipes_changed.send(sender=Recipe, recipe_ids=recipe_ids)
+        return len(recipes)
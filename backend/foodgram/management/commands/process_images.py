@@ -0,0 +1,41 @@
+from django.core.management import BaseCommand
+
+from foodgram.images import MAX_ATTEMPTS, process_job, reclaim_stale_jobs
+from foodgram.models import ImageJob, Recipe
+
+
+class Command(BaseCommand):
+    help = 'Обрабатывает незавершённые задачи по изображениям рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backfill',
+            action='store_true',
+            help='Создать задачи для рецептов без уменьшенных копий'
+        )
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            recipes = Recipe.objects.filter(image_variants={}).exclude(
+                image_jobs__status__in=(
+                    ImageJob.PENDING, ImageJob.PROCESSING
+                )
+            ).values_list('pk', 'image')
+            created = ImageJob.objects.bulk_create(
+                ImageJob(recipe_id=pk, image=image) for pk, image in recipes
+            )
+            self.stdout.write(f'Создано задач: {len(created)}')
+        reclaimed = reclaim_stale_jobs()
+        if reclaimed:
+            self.stdout.write(f'Возвращено в очередь задач: {reclaimed}')
+        jobs = ImageJob.objects.filter(
+            status__in=(ImageJob.PENDING, ImageJob.FAILED),
+            attempts__lt=MAX_ATTEMPTS
+        ).order_by('pk').values_list('pk', flat=True)
+        done = 0
+        for job_id in jobs.iterator():
+            process_job(job_id)
+            done += 1
+        self.stdout.write(
+            self.style.SUCCESS(f'Обработано задач: {done}')
+        )
@@ -0,0 +1,60 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from foodgram.models import Cart, Favorite, Recipe
+from users.models import User
+
+
+def count_related(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'cart_count', Cart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики избранного, корзины и рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не изменяя'
+        )
+
+    def handle(self, *args, **options):
+        for model, field, related_model, related_field in COUNTERS:
+            actual = count_related(related_model, related_field)
+            with transaction.atomic():
+                drift = list(
+                    model.objects.select_for_update().annotate(
+                        actual=actual
+                    ).exclude(**{field: F('actual')}).order_by().values_list(
+                        'pk', field, 'actual'
+                    )
+                )
+                if drift and not options['dry_run']:
+                    model.objects.filter(
+                        pk__in=[pk for pk, _, _ in drift]
+                    ).update(**{field: actual})
+            name = f'{model._meta.model_name}.{field}'
+            if not drift:
+                self.stdout.write(self.style.SUCCESS(
+                    f'{name}: расхождений нет'
+                ))
+                continue
+            self.stdout.write(self.style.WARNING(
+                f'{name}: расхождений {len(drift)}'
+            ))
+            for pk, stored, expected in drift[:20]:
+                self.stdout.write(f'  id={pk}: {stored} -> {expected}')
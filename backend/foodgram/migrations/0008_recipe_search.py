@@ -0,0 +1,72 @@
+# Generated by Django 3.2.13 on 2026-10-18 19:42
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# SQL скопирован из foodgram.search на момент миграции, чтобы её
+# результат не зависел от последующих изменений модуля.
+FTS_TABLE = 'foodgram_recipe_fts'
+INGREDIENT_NAMES = (
+    "SELECT {}(i.name, ' ') FROM foodgram_amount a "
+    "JOIN foodgram_ingredient i ON i.id = a.ingredient_id "
+    "WHERE a.recipe_id = r.id"
+)
+
+POSTGRES_CREATE = (
+    'CREATE INDEX IF NOT EXISTS foodgram_recipe_search_gin '
+    'ON foodgram_recipe USING gin (search_vector)'
+)
+POSTGRES_DROP = 'DROP INDEX IF EXISTS foodgram_recipe_search_gin'
+POSTGRES_UPDATE = (
+    'UPDATE foodgram_recipe r SET search_vector = '
+    "setweight(to_tsvector('russian', coalesce(r.name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(r.text, '')), 'B') || "
+    "setweight(to_tsvector('russian', "
+    f"coalesce(({INGREDIENT_NAMES.format('string_agg')}), '')), 'C')"
+)
+
+SQLITE_CREATE = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+    "name, text, ingredients, tokenize='unicode61 remove_diacritics 2')"
+)
+SQLITE_DROP = f'DROP TABLE IF EXISTS {FTS_TABLE}'
+SQLITE_INSERT = (
+    f'INSERT INTO {FTS_TABLE} (rowid, name, text, ingredients) '
+    'SELECT r.id, r.name, r.text, '
+    f"coalesce(({INGREDIENT_NAMES.format('group_concat')}), '') "
+    'FROM foodgram_recipe r'
+)
+
+
+def build_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_CREATE)
+        schema_editor.execute(POSTGRES_UPDATE)
+    elif vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+        schema_editor.execute(SQLITE_INSERT)
+
+
+def remove_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_DROP)
+    elif vendor == 'sqlite':
+        schema_editor.execute(SQLITE_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0007_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(build_search_index, remove_search_index),
+    ]
@@ -1,3 +1,4 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.core import validators
 from django.db import models
 
@@ -50,6 +51,18 @@ class Ingredient(models.Model):
         return f'{self.name}'
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self):
+        """Подтягивает автора, теги и ингредиенты для ленты рецептов."""
+        return self.select_related('author').prefetch_related(
+            'tags',
+            models.Prefetch(
+                'ingredient_amount',
+                queryset=Amount.objects.select_related('ingredient')
+            )
+        )
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -66,6 +79,12 @@ class Recipe(models.Model):
         'Изображение блюда',
         upload_to='recipes/',
     )
+    image_variants = models.JSONField(
+        'Уменьшенные копии изображения',
+        default=dict,
+        blank=True,
+        editable=False
+    )
     text = models.TextField('Описание рецепта')
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -91,6 +110,24 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    favorites_count = models.PositiveIntegerField(
+        'Количество добавлений в избранное',
+        default=0,
+        editable=False,
+        db_index=True
+    )
+    cart_count = models.PositiveIntegerField(
+        'Количество добавлений в список покупок',
+        default=0,
+        editable=False
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
@@ -182,6 +219,23 @@ class Cart(models.Model):
         ]
 
 
+class FollowQuerySet(models.QuerySet):
+    def with_recipes(self, recipes_limit=None):
+        """Подтягивает автора и его последние рецепты."""
+        recipes = Recipe.objects.all()
+        if recipes_limit is not None:
+            recipes = recipes.filter(pk__in=models.Subquery(
+                Recipe.objects.filter(
+                    author=models.OuterRef('author')
+                ).values('pk')[:recipes_limit]
+            ))
+        return self.select_related('author').prefetch_related(
+            models.Prefetch(
+                'author__recipes', queryset=recipes, to_attr='limited_recipes'
+            )
+        )
+
+
 class Follow(models.Model):
     user = models.ForeignKey(
          User, on_delete=models.CASCADE, related_name='follower'
@@ -190,6 +244,8 @@ class Follow(models.Model):
          User, on_delete=models.CASCADE, related_name='following'
     )
 
+    objects = FollowQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Подписки'
         verbose_name_plural = 'Подписки'
@@ -197,3 +253,56 @@ class Follow(models.Model):
             fields=('user', 'author',), name="unique_follow"
         )]
         ordering = ('id',)
+
+
+class ImageJob(models.Model):
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (PROCESSING, 'Обрабатывается'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='image_jobs',
+        verbose_name='Рецепт'
+    )
+    image = models.CharField('Исходное изображение', max_length=255)
+    status = models.CharField(
+        'Статус',
+        choices=STATUSES,
+        max_length=20,
+        default=PENDING,
+        db_index=True
+    )
+    attempts = models.PositiveSmallIntegerField('Попытки', default=0)
+    error = models.TextField('Ошибка', blank=True)
+    created = models.DateTimeField('Создана', auto_now_add=True)
+    updated = models.DateTimeField('Изменена', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Обработка изображения'
+        verbose_name_plural = 'Обработка изображений'
+        ordering = ('-created',)
+
+    def __str__(self):
+        return f'{self.image} ({self.status})'
+
+
+class ReferenceFile(models.Model):
+    """Контрольная сумма последнего загруженного файла справочника."""
+    name = models.CharField('Файл', max_length=255, unique=True)
+    checksum = models.CharField('SHA-256', max_length=64)
+    loaded = models.DateTimeField('Загружен', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Файл справочника'
+        verbose_name_plural = 'Файлы справочников'
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,123 @@
+"""Полнотекстовый поиск рецептов.
+
+В PostgreSQL используется колонка search_vector (tsvector с весами:
+название — A, описание — B, ингредиенты — C) и GIN-индекс по ней.
+В SQLite тот же набор полей хранится в виртуальной таблице FTS5, чтобы
+поиск можно было проверять локально. На остальных СУБД поиск сводится
+к icontains по названию и описанию.
+"""
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection as default_connection, connections
+from django.db.models import F, Q
+
+CONFIG = 'russian'
+FTS_TABLE = 'foodgram_recipe_fts'
+INGREDIENT_NAMES = (
+    "SELECT string_agg(i.name, ' ') FROM foodgram_amount a "
+    "JOIN foodgram_ingredient i ON i.id = a.ingredient_id "
+    "WHERE a.recipe_id = r.id"
+)
+
+POSTGRES_CREATE = (
+    'CREATE INDEX IF NOT EXISTS foodgram_recipe_search_gin '
+    'ON foodgram_recipe USING gin (search_vector)'
+)
+POSTGRES_DROP = 'DROP INDEX IF EXISTS foodgram_recipe_search_gin'
+POSTGRES_UPDATE = (
+    'UPDATE foodgram_recipe r SET search_vector = '
+    f"setweight(to_tsvector('{CONFIG}', coalesce(r.name, '')), 'A') || "
+    f"setweight(to_tsvector('{CONFIG}', coalesce(r.text, '')), 'B') || "
+    f"setweight(to_tsvector('{CONFIG}', "
+    f"coalesce(({INGREDIENT_NAMES}), '')), 'C')"
+)
+
+SQLITE_CREATE = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+    "name, text, ingredients, tokenize='unicode61 remove_diacritics 2')"
+)
+SQLITE_DROP = f'DROP TABLE IF EXISTS {FTS_TABLE}'
+SQLITE_INSERT = (
+    f'INSERT INTO {FTS_TABLE} (rowid, name, text, ingredients) '
+    'SELECT r.id, r.name, r.text, coalesce(('
+    + INGREDIENT_NAMES.replace("string_agg(i.name, ' ')",
+                               "group_concat(i.name, ' ')")
+    + "), '') FROM foodgram_recipe r"
+)
+# Веса столбцов name, text, ingredients для bm25 (меньше — лучше) в том же
+# соотношении, что веса A, B и C в ts_rank PostgreSQL.
+SQLITE_RANK = f'bm25({FTS_TABLE}, 10.0, 4.0, 2.0)'
+
+
+def create_search_index(connection=default_connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(POSTGRES_CREATE)
+        elif connection.vendor == 'sqlite':
+            cursor.execute(SQLITE_CREATE)
+
+
+def drop_search_index(connection=default_connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(POSTGRES_DROP)
+        elif connection.vendor == 'sqlite':
+            cursor.execute(SQLITE_DROP)
+
+
+def id_filter(column, recipe_ids):
+    if recipe_ids is None:
+        return '', []
+    recipe_ids = list(recipe_ids)
+    placeholders = ', '.join(['%s'] * len(recipe_ids)) or 'NULL'
+    return f' WHERE {column} IN ({placeholders})', recipe_ids
+
+
+def update_search_index(recipe_ids=None, connection=default_connection):
+    """Пересчитывает поисковые данные рецептов; None — всех рецептов."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            where, params = id_filter('r.id', recipe_ids)
+            cursor.execute(POSTGRES_UPDATE + where, params)
+        elif connection.vendor == 'sqlite':
+            delete_from_search_index(recipe_ids, connection)
+            where, params = id_filter('r.id', recipe_ids)
+            cursor.execute(SQLITE_INSERT + where, params)
+
+
+def delete_from_search_index(recipe_ids=None, connection=default_connection):
+    if connection.vendor != 'sqlite':
+        return
+    where, params = id_filter('rowid', recipe_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}' + where, params)
+
+
+def fts5_query(value):
+    terms = value.replace('"', ' ').split()
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_recipes(queryset, value):
+    """Фильтрует рецепты по запросу и упорядочивает по релевантности."""
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        query = SearchQuery(value, config=CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date', '-id')
+    if vendor == 'sqlite':
+        match = fts5_query(value)
+        if not match:
+            return queryset
+        # Таблица FTS присоединяется к запросу один раз: MATCH выполняется
+        # однократно, и bm25 считается для той же найденной строки.
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[
+                f'{FTS_TABLE}.rowid = foodgram_recipe.id',
+                f'{FTS_TABLE} MATCH %s',
+            ],
+            params=[match],
+            select={'rank': SQLITE_RANK},
+        ).order_by('rank', '-pub_date', '-id')
+    return queryset.filter(Q(name__icontains=value) | Q(text__icontains=value))
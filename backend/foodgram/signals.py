@@ -0,0 +1,91 @@
+import logging
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from users.models import User
+from .models import Amount, Cart, Favorite, Ingredient, Recipe
+from .search import delete_from_search_index, update_search_index
+
+# Отправляется после массовых изменений рецептов в обход save():
+# queryset.update(), bulk_create() и т. п. Аргумент recipe_ids — список id.
+recipes_changed = Signal()
+
+# Отправляется после массовой загрузки справочника (db_load): sender —
+# Ingredient или Tag, updated_ids — id записей, изменённых на месте.
+reference_data_changed = Signal()
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = {
+    Favorite: 'favorites_count',
+    Cart: 'cart_count',
+}
+
+
+def change_counter(model, pk, field, delta):
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    if not queryset.update(**{field: F(field) + delta}) and delta < 0:
+        # Счётчик разошёлся с данными; rebuild_counters его исправит.
+        logger.warning(
+            'Счётчик %s.%s не уменьшен: объект %s не найден или значение '
+            'меньше %s', model.__name__, field, pk, -delta
+        )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Cart)
+def increment_recipe_counter(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, COUNTERS[sender], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Cart)
+def decrement_recipe_counter(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, COUNTERS[sender], -1)
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+def schedule_search_update(recipe_ids):
+    transaction.on_commit(lambda: update_search_index(recipe_ids))
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search(sender, instance, **kwargs):
+    schedule_search_update([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_search(sender, instance, **kwargs):
+    delete_from_search_index([instance.pk])
+
+
+@receiver(post_save, sender=Amount)
+@receiver(post_delete, sender=Amount)
+def update_amount_search(sender, instance, **kwargs):
+    schedule_search_update([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_search(sender, instance, created, **kwargs):
+    if not created:
+        schedule_search_update(list(
+            Amount.objects.filter(ingredient=instance).values_list(
+                'recipe_id', flat=True
+            )
+        ))
@@ -0,0 +1,41 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла — SHA-256 его содержимого.
+
+    Файл кладётся в каталог из upload_to с подкаталогом по первым двум
+    символам хэша. Если такой файл уже есть, повторная запись не
+    выполняется. Содержимое по имени никогда не меняется, поэтому его
+    можно отдавать с неограниченным сроком кэширования.
+    """
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        directory, filename = posixpath.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        hexdigest = digest.hexdigest()
+        return posixpath.join(
+            directory, hexdigest[:2], f'{hexdigest}{extension}'
+        )
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        try:
+            # Повторная загрузка обновляет время изменения файла, чтобы
+            # gc_media не удалил его как старый файл без ссылок до того,
+            # как рецепт со ссылкой на него будет сохранён.
+            os.utime(self.path(name))
+            return name
+        except FileNotFoundError:
+            return super()._save(name, content)
@@ -0,0 +1,117 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from api.metrics import record_cache
+
+from .models import User
+
+CACHE_KEY = 'auth_token:{}'
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Кэш токенов должен быть общим для всех воркеров: иначе выход,
+    смена пароля и блокировка сбрасывают его только в одном процессе.
+    """
+    if settings.AUTH_TOKEN_CACHE_TIMEOUT <= 0:
+        return []
+    if not isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache):
+        return []
+    return [Warning(
+        'Токены кэшируются в памяти процесса.',
+        hint='Укажите CACHE_BACKEND с общим хранилищем (memcached) '
+             'или AUTH_TOKEN_CACHE_TIMEOUT=0.',
+        id='users.W001',
+    )]
+
+
+def evict_token(key):
+    cache.delete(CACHE_KEY.format(key))
+
+
+def token_expires(created):
+    if settings.AUTH_TOKEN_TTL is None:
+        return None
+    return created + timedelta(seconds=settings.AUTH_TOKEN_TTL)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену с кэшированием пользователя.
+
+    Пользователь и дата создания токена хранятся в кэше не дольше
+    AUTH_TOKEN_CACHE_TIMEOUT секунд, поэтому обычно запрос аутентифицируется
+    без обращения к БД. Кэш должен быть общим для всех воркеров (memcached),
+    иначе выход и смена пароля сбрасывают его только в одном процессе; при
+    AUTH_TOKEN_CACHE_TIMEOUT=0 токен читается из БД на каждый запрос. Если
+    задан AUTH_TOKEN_TTL, токен старше этого срока удаляется и запрос
+    отклоняется.
+    """
+
+    def load_token(self, key):
+        try:
+            token = self.get_model().objects.select_related('user').get(
+                key=key
+            )
+        except self.get_model().DoesNotExist:
+            raise AuthenticationFailed('Недействительный токен.')
+        timeout = settings.AUTH_TOKEN_CACHE_TIMEOUT
+        expires = token_expires(token.created)
+        if expires is not None and timeout > 0:
+            remaining = (expires - timezone.now()).total_seconds()
+            timeout = max(min(timeout, int(remaining)), 1)
+        cached = (token.user, token.created)
+        if timeout > 0:
+            cache.set(CACHE_KEY.format(key), cached, timeout)
+        return cached
+
+    def authenticate_credentials(self, key):
+        cached = None
+        if settings.AUTH_TOKEN_CACHE_TIMEOUT > 0:
+            cached = cache.get(CACHE_KEY.format(key))
+            record_cache('auth_token', cached is not None, cached is None)
+        if cached is None:
+            cached = self.load_token(key)
+        user, created = cached
+        expires = token_expires(created)
+        if expires is not None and expires <= timezone.now():
+            self.get_model().objects.filter(key=key).delete()
+            evict_token(key)
+            raise AuthenticationFailed('Срок действия токена истёк.')
+        if not user.is_active:
+            raise AuthenticationFailed(
+                'Пользователь не активен или удалён.'
+            )
+        return user, self.get_model()(key=key, user=user, created=created)
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    # После удаления Django обнуляет первичный ключ, то есть сам токен.
+    key = instance.key
+    transaction.on_commit(lambda: evict_token(key))
+
+
+@receiver(post_save, sender=User)
+def evict_user_tokens(sender, instance, created, **kwargs):
+    """Сбрасывает кэш токенов пользователя при любом изменении его данных:
+    смене пароля, блокировке, редактировании профиля.
+    """
+    if created:
+        return
+    keys = list(
+        Token.objects.filter(user_id=instance.pk).values_list('key', flat=True)
+    )
+    transaction.on_commit(lambda: cache.delete_many(
+        [CACHE_KEY.format(key) for key in keys]
+    ))
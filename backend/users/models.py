@@ -17,6 +17,11 @@ class User(AbstractUser):
         max_length=20,
         default='user'
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         ordering = ('id',)
@@ -3,7 +3,7 @@ from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 from rest_framework.validators import UniqueValidator
 
-from foodgram.models import Follow
+from api.membership import get_membership
 from .models import User
 
 
@@ -18,11 +18,9 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        if self.context['request'].user.is_authenticated and (
-                Follow.objects.filter(
-                    user=self.context['request'].user, author=obj).exists()):
-            return True
-        return False
+        return obj.id in get_membership(
+            self.context['request'].user
+        )['follows']
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
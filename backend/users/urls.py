@@ -1,6 +1,7 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from api.concurrency import with_concurrent_reads
 from users.views import CustomUserViewSet
 
 app_name = 'api'
@@ -9,7 +10,7 @@ router = DefaultRouter()
 router.register('users', CustomUserViewSet)
 
 urlpatterns = [
-    path('', include(router.urls)),
+    path('', include(with_concurrent_reads(router.urls))),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
 ]
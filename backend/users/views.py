@@ -5,8 +5,11 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from api.membership import get_membership
 from api.pagination import LimitPageNumberPagination
+from api.representations import USER_FIELDS, subscription_rows, user_rows
 from api.serializers import FollowSerializer
+from api.timing import measure
 from foodgram.models import Follow
 from .models import User
 
@@ -19,17 +22,30 @@ class CustomUserViewSet(UserViewSet):
             self.permission_classes = [IsAuthenticated]
         return super().get_permissions()
 
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).values(
+            *USER_FIELDS
+        )
+        page = self.paginate_queryset(queryset)
+        with measure('serialize'):
+            data = user_rows(page, get_membership(request.user)['follows'])
+        return self.get_paginated_response(data)
+
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdigit():
+            return int(recipes_limit)
+        return None
+
     @action(detail=False, permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
         user = request.user
-        queryset = Follow.objects.filter(user=user)
+        recipes_limit = self.get_recipes_limit()
+        queryset = Follow.objects.filter(user=user).with_recipes(recipes_limit)
         pages = self.paginate_queryset(queryset)
-        serializer = FollowSerializer(
-            pages,
-            many=True,
-            context={'request': request}
-        )
-        return self.get_paginated_response(serializer.data)
+        with measure('serialize'):
+            data = subscription_rows(pages)
+        return self.get_paginated_response(data)
 
     @action(
         detail=True, methods=['post', 'delete'],
@@ -42,7 +58,14 @@ class CustomUserViewSet(UserViewSet):
             request.data.update(
                 dict(user=f'{request.user.id}', following=f'{following.id}')
             )
-            serializer = FollowSerializer(data=request.data, partial=True)
+            serializer = FollowSerializer(
+                data=request.data,
+                partial=True,
+                context={
+                    'request': request,
+                    'recipes_limit': self.get_recipes_limit()
+                }
+            )
             serializer.is_valid(raise_exception=True)
             serializer.save(author=following, user=request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)